@@ -1,31 +1,97 @@
 import markdown2
 import re
 from pygments import highlight
-from pygments.lexers import get_lexer_by_name, guess_lexer
+from pygments.lexers import get_all_lexers, get_lexer_by_name
+from pygments.lexers.special import TextLexer
 from pygments.formatters import HtmlFormatter
-from pygments.util import ClassNotFound
-from utils.mermaid_renderer import MermaidRenderer
+from utils.mermaid_renderer import get_renderer
+
+# Fenced code block with optional language specification
+_FENCED_CODE_RE = re.compile(r'```(\w+)?\n(.*?)```', re.DOTALL)
+
+# ATX heading line: leading # markers and the stripped heading text
+_HEADING_RE = re.compile(r'^(#+)[^\S\n]*([^\n]*?)[^\S\n]*$', re.MULTILINE)
+
+# Single-pass scanner used by process_markdown: fenced code blocks and heading
+# lines, in that priority
+_MARKDOWN_BLOCK_RE = re.compile(
+    r'```(?P<language>\w+)?\n(?P<code>.*?)```'
+    r'|^(?P<markers>#+)[^\S\n]*(?P<heading>[^\n]*?)[^\S\n]*$',
+    re.DOTALL | re.MULTILINE
+)
+
+# Placeholder left in the markdown for a rendered code block; markdown2 wraps
+# it in a paragraph, so the paragraph tags are replaced along with it
+_CODE_SLOT_RE = re.compile(r'<p>\x00CODE(\d+)\x00</p>|\x00CODE(\d+)\x00')
+
+# Every language alias Pygments can resolve, so unknown fence languages are
+# detected with a set lookup instead of a ClassNotFound exception
+_KNOWN_LEXER_ALIASES = frozenset(
+    alias.lower() for _, aliases, _, _ in get_all_lexers() for alias in aliases
+)
+
+# Maximum number of highlighted code blocks kept per processor
+HIGHLIGHT_CACHE_SIZE = 4096
+
+def _frontmatter_end(content):
+    """
+    Find where the body starts after a leading YAML front matter block.
+    
+    The front matter opens with a line starting with --- (after any leading
+    whitespace) and ends at the first later line that contains only ---.
+    Only the '---' candidates are visited, using str.find, so the body of
+    the document is never scanned line by line.
+    
+    Args:
+        content: Raw markdown content
+        
+    Returns:
+        Offset of the first non-whitespace character after the closing
+        delimiter, or 0 if there is no complete front matter block
+    """
+    length = len(content)
+    start = 0
+    while start < length and content[start].isspace():
+        start += 1
+    if not content.startswith('---', start):
+        return 0
+    
+    position = content.find('\n', start)
+    while position != -1:
+        position = content.find('---', position + 1)
+        if position == -1:
+            break
+        line_start = content.rfind('\n', 0, position) + 1
+        line_end = content.find('\n', position)
+        if line_end == -1:
+            line_end = length
+        if content[line_start:line_end].strip() == '---':
+            # Skip the whitespace between the closing delimiter and the body
+            body_start = line_end
+            while body_start < length and content[body_start].isspace():
+                body_start += 1
+            return body_start
+        position = line_end
+    
+    # No closing delimiter
+    return 0
 
 class MarkdownProcessor:
-    def __init__(self):
+    def __init__(self, mermaid_cache_dir=None):
         # Create HTML formatter for syntax highlighting
         self.formatter = HtmlFormatter(style='default', cssclass='highlight')
-        # Initialize Mermaid renderer
-        self.mermaid_renderer = MermaidRenderer()
-    
-    def process_markdown(self, markdown_content):
-        # Remove YAML front matter if present
-        markdown_content = self.remove_yaml_frontmatter(markdown_content)
-        
-        # Adjust heading levels for proper hierarchy (shift all headings down by 3 levels)
-        markdown_content = self.adjust_heading_levels(markdown_content)
-        
-        # Apply syntax highlighting to code blocks before markdown processing
-        markdown_content = self.apply_syntax_highlighting(markdown_content)
-        
-        # Convert Markdown to HTML using markdown2
-        html_content = markdown2.markdown(
-            markdown_content, 
+        # Lexers resolved by language name, reused across code blocks
+        self.lexer_cache = {}
+        # Plain-text lexer for code blocks without a language
+        self.text_lexer = TextLexer(stripall=True)
+        # Highlighted HTML keyed by (language, code) for repeated snippets
+        self.highlight_cache = {}
+        # Process-wide Mermaid renderer, caching rendered SVGs in mermaid_cache_dir
+        self.mermaid_renderer = get_renderer(mermaid_cache_dir)
+        # Number of Mermaid diagrams that fell back to a plain code block
+        self.mermaid_failures = 0
+        # Build the markdown2 converter once; it resets its own state per convert() call
+        self.markdowner = markdown2.Markdown(
             extras=[
                 'fenced-code-blocks', 
                 'tables', 
@@ -33,50 +99,163 @@ class MarkdownProcessor:
                 'code-friendly'
             ]
         )
+    
+    def process_markdown(self, markdown_content):
+        # Rendered code blocks, kept out of the markdown so markdown2 does not
+        # have to scan their HTML, and the Mermaid diagrams still to be rendered
+        code_blocks = []
+        mermaid_jobs = []
+        
+        # Drop NUL characters, which are reserved for the code block placeholders
+        if '\x00' in markdown_content:
+            markdown_content = markdown_content.replace('\x00', '')
+        
+        # Remove YAML front matter if present
+        body_start = _frontmatter_end(markdown_content)
+        if body_start:
+            markdown_content = markdown_content[body_start:]
+        
+        if '```' in markdown_content:
+            # Shift headings down by 3 levels and highlight code blocks in a
+            # single scan over the document
+            markdown_content = _MARKDOWN_BLOCK_RE.sub(
+                lambda match: self._transform_block(match, code_blocks, mermaid_jobs), markdown_content
+            )
+            if mermaid_jobs:
+                self._render_mermaid_blocks(mermaid_jobs, code_blocks)
+        else:
+            # No fenced code blocks, so only headings need rewriting
+            markdown_content = self.adjust_heading_levels(markdown_content)
+        
+        # Convert Markdown to HTML using the shared markdown2 converter
+        html_content = self.markdowner.convert(markdown_content)
+        
+        # Splice the rendered code blocks back in place of their placeholders
+        if code_blocks:
+            html_content = _CODE_SLOT_RE.sub(
+                lambda match: code_blocks[int(match.group(1) or match.group(2))], html_content
+            )
         return html_content
     
+    def _transform_block(self, match, code_blocks, mermaid_jobs):
+        """Rewrite one block matched by the single-pass scanner in process_markdown"""
+        if match.group('markers') is not None:
+            return self._shift_heading(match.group('markers'), match.group('heading'))
+        
+        language = match.group('language')
+        code = match.group('code')
+        if language and language.lower() == 'mermaid' and code.strip():
+            # Reserve a slot; all diagrams of the document are rendered together later
+            mermaid_jobs.append((len(code_blocks), code))
+            code_blocks.append(None)
+        else:
+            code_html = self._highlight_code(language, code)
+            if code_html is None:
+                # Leave the block for markdown2's fenced-code-blocks extra
+                return match.group(0)
+            code_blocks.append(code_html)
+        placeholder = f'\x00CODE{len(code_blocks) - 1}\x00'
+        
+        # A fence at the start of a line becomes its own block, like the raw
+        # HTML it replaces; an indented fence (e.g. inside a list item) stays inline
+        line_start = match.string.rfind('\n', 0, match.start()) + 1
+        if line_start == match.start():
+            return f'\n\n{placeholder}\n\n'
+        prefix = match.string[line_start:match.start()]
+        if '>' in prefix and not prefix.strip(' \t>'):
+            # Inside a blockquote, keep the quote markers and make the
+            # placeholder its own paragraph, so the block is not nested in one
+            return f'\n{prefix}\n{prefix}{placeholder}\n{prefix}'
+        return placeholder
+    
+    def _render_mermaid_blocks(self, mermaid_jobs, code_blocks):
+        """
+        Render all Mermaid diagrams of a document concurrently.
+        
+        Args:
+            mermaid_jobs: List of (slot index, diagram source) tuples
+            code_blocks: Code block slots to fill with the rendered HTML
+        """
+        sources = [code.strip() for _, code in mermaid_jobs]
+        try:
+            results = self.mermaid_renderer.render_mermaid_batch_sync(sources)
+        except Exception as e:
+            # The browser could not be started; every diagram falls back
+            results = [e] * len(sources)
+        
+        for (index, code), result in zip(mermaid_jobs, results):
+            if isinstance(result, BaseException):
+                print(f"Warning: Failed to render Mermaid diagram: {result}")
+                code_blocks[index] = self._mermaid_fallback_html(code)
+            else:
+                code_blocks[index] = self._mermaid_html(result)
+    
+    def _mermaid_html(self, svg_content):
+        """Wrap a rendered Mermaid SVG for the PDF"""
+        return f'<div class="mermaid-diagram" style="text-align: center; margin: 20px 0;">{svg_content}</div>'
+    
+    def _mermaid_fallback_html(self, code):
+        """Show Mermaid source as a regular code block when rendering fails"""
+        self.mermaid_failures += 1
+        return f'<pre><code class="language-mermaid">{code}</code></pre>'
+    
+    def _get_lexer(self, language):
+        """Return the cached lexer for a known language name"""
+        lexer = self.lexer_cache.get(language)
+        if lexer is None:
+            lexer = get_lexer_by_name(language, stripall=True)
+            self.lexer_cache[language] = lexer
+        return lexer
+    
     def apply_syntax_highlighting(self, content):
         """Apply syntax highlighting to fenced code blocks and render Mermaid diagrams"""
-        # Pattern to match fenced code blocks with optional language specification
-        pattern = r'```(\w+)?\n(.*?)```'
+        # Skip the regex scan entirely when there is no code fence
+        if '```' not in content:
+            return content
+        return _FENCED_CODE_RE.sub(
+            lambda match: self._highlight_code(match.group(1), match.group(2)) or match.group(0), content
+        )
+    
+    def _highlight_code(self, language, code):
+        """
+        Render a single fenced code block as highlighted HTML or a Mermaid diagram.
         
-        def highlight_code(match):
-            language = match.group(1) if match.group(1) else None
-            code = match.group(2)
-            
-            if not code.strip():
-                return f'```{language or ""}\n{code}```'
-            
-            # Handle Mermaid diagrams
-            if language and language.lower() == 'mermaid':
-                try:
-                    svg_content = self.mermaid_renderer.render_mermaid_sync(code.strip())
-                    return f'<div class="mermaid-diagram" style="text-align: center; margin: 20px 0;">{svg_content}</div>'
-                except Exception as e:
-                    print(f"Warning: Failed to render Mermaid diagram: {e}")
-                    # Fallback to regular code block
-                    return f'<pre><code class="language-mermaid">{code}</code></pre>'
-            
+        Returns None when the block should be left as markdown (empty code or
+        an unknown language).
+        """
+        if not code.strip():
+            return None
+        
+        # Handle Mermaid diagrams
+        if language and language.lower() == 'mermaid':
             try:
-                # Try to get lexer by language name
-                if language:
-                    lexer = get_lexer_by_name(language, stripall=True)
-                else:
-                    # Try to guess the language
-                    lexer = guess_lexer(code)
-                
-                # Generate highlighted HTML
-                highlighted = highlight(code, lexer, self.formatter)
-                
-                # Return the highlighted code wrapped in a div
-                return f'<div class="codehilite">{highlighted}</div>'
-                
-            except ClassNotFound:
-                # If language is not recognized, return original code block
-                return f'```{language or ""}\n{code}```'
-        
-        # Apply highlighting to all code blocks
-        return re.sub(pattern, highlight_code, content, flags=re.DOTALL)
+                svg_content = self.mermaid_renderer.render_mermaid_sync(code.strip())
+                return self._mermaid_html(svg_content)
+            except Exception as e:
+                print(f"Warning: Failed to render Mermaid diagram: {e}")
+                # Fallback to regular code block
+                return self._mermaid_fallback_html(code)
+        
+        cache_key = (language or '', code)
+        if cache_key in self.highlight_cache:
+            return self.highlight_cache[cache_key]
+        
+        if language and language.lower() not in _KNOWN_LEXER_ALIASES:
+            # If language is not recognized, keep the original code block
+            result = None
+        else:
+            # Render unlabeled code as plain text rather than guessing the language
+            lexer = self._get_lexer(language) if language else self.text_lexer
+            
+            # Generate highlighted HTML wrapped in a div
+            highlighted = highlight(code, lexer, self.formatter)
+            result = f'<div class="codehilite">{highlighted}</div>'
+        
+        # Evict the oldest entry once the cache is full
+        if len(self.highlight_cache) >= HIGHLIGHT_CACHE_SIZE:
+            del self.highlight_cache[next(iter(self.highlight_cache))]
+        self.highlight_cache[cache_key] = result
+        return result
     
     def adjust_heading_levels(self, content):
         """
@@ -96,31 +275,13 @@ class MarkdownProcessor:
         Returns:
             Markdown content with adjusted heading levels
         """
-        lines = content.split('\n')
-        adjusted_lines = []
-        
-        for line in lines:
-            # Check if line starts with heading markers
-            if line.startswith('#'):
-                # Count the number of # characters
-                heading_level = 0
-                for char in line:
-                    if char == '#':
-                        heading_level += 1
-                    else:
-                        break
-                
-                # Adjust heading level (add 3 to shift H1->H4, H2->H5, etc.)
-                new_heading_level = min(heading_level + 3, 6)  # Max heading level is H6
-                
-                # Reconstruct the heading with new level
-                heading_text = line[heading_level:].strip()
-                adjusted_line = '#' * new_heading_level + ' ' + heading_text
-                adjusted_lines.append(adjusted_line)
-            else:
-                adjusted_lines.append(line)
-        
-        return '\n'.join(adjusted_lines)
+        return _HEADING_RE.sub(lambda match: self._shift_heading(match.group(1), match.group(2)), content)
+    
+    def _shift_heading(self, markers, heading_text):
+        """Rebuild a heading line with its level shifted down by 3"""
+        # Adjust heading level (add 3 to shift H1->H4, H2->H5, etc.)
+        new_heading_level = min(len(markers) + 3, 6)  # Max heading level is H6
+        return '#' * new_heading_level + ' ' + heading_text
     
     def remove_yaml_frontmatter(self, content):
         """
@@ -138,30 +299,10 @@ class MarkdownProcessor:
         Returns:
             Markdown content with YAML front matter removed
         """
-        # Check if content starts with YAML front matter delimiter
-        if not content.strip().startswith('---'):
+        body_start = _frontmatter_end(content)
+        if not body_start:
+            # No complete front matter block, return original content
             return content
         
-        # Find the end of the YAML front matter
-        # Look for the closing --- on a line by itself
-        lines = content.split('\n')
-        end_index = None
-        
-        # Start from line 1 (skip the opening ---)
-        for i in range(1, len(lines)):
-            line = lines[i].strip()
-            if line == '---':
-                end_index = i
-                break
-        
-        # If we found the closing delimiter, remove the front matter
-        if end_index is not None:
-            # Keep everything after the closing --- line
-            remaining_lines = lines[end_index + 1:]
-            cleaned_content = '\n'.join(remaining_lines)
-            # Remove any leading whitespace that might be left
-            cleaned_content = cleaned_content.lstrip()
-            return cleaned_content
-        
-        # If no closing delimiter found, return original content
-        return content
+        # Keep everything after the closing --- line, without leading whitespace
+        return content[body_start:]
@@ -1,123 +1,523 @@
+import hashlib
+import io
+import multiprocessing
 import os
-from weasyprint import HTML
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+from utils.file_utils import read_file, write_file
+from utils.mermaid_renderer import MERMAID_CACHE_VERSION, shared_renderer_running
 from .markdown_processor import MarkdownProcessor
 
+# Template placeholders and style tags (placeholders inside a style element
+# are escaped for CSS)
+_TEMPLATE_SLOT_RE = re.compile(r'\{\{\s*(title|author|content)\s*\}\}|(?i:<style\b|</style>)')
+
+# Closing head tag, in any letter case
+_HEAD_RE = re.compile(r'</head>', re.IGNORECASE)
+
+# Characters escaped in user-provided text (titles, author) inserted into HTML
+_HTML_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'})
+
+# Characters escaped in user-provided text inserted into a quoted CSS string
+_CSS_STRING_ESCAPE = str.maketrans({
+    '\\': '\\\\', '"': '\\"', "'": "\\'", '<': '\\3c ', '\n': '\\a ',
+})
+
+def _escape_html(text):
+    """Escape a title or author string for insertion into HTML"""
+    return str(text).translate(_HTML_ESCAPE)
+
+# Section header fragments for export_to_pdf_with_sections (values are escaped by the caller)
+_MAJOR_SECTION_HEADER = '<div class="major-section-header"><h2 class="major-section-title">%s</h2>%s</div>'
+_SUBSECTION_HEADER = '<div class="subsection-header"><h3 class="subsection-title">%s</h3></div>'
+_SECTION_HEADER = '<div class="section-header"><h2 class="section-title">%s</h2></div>'
+_TOC = "<div class='major-section-toc'>%s</div>"
+_TOC_ITEM = "<div class='toc-item'><div class='toc-section-title'>%s. %s</div></div>"
+
+# Page break inserted after each converted file
+_FILE_PAGE_BREAK = "<div style='page-break-after: always;'></div>"
+
+# Page break appended after a major section's files
+_MAJOR_SECTION_BREAK = "<div style='page-break-before: always;'></div>"
+
+# Section types whose header starts a new page (page-break-before in the
+# default and bundled templates)
+_PAGE_BREAKING_SECTION_TYPES = frozenset(('major_section', 'section'))
+
+# Bump when MarkdownProcessor output changes so stale cached HTML is not reused;
+# the cache key also includes MERMAID_CACHE_VERSION, since the HTML embeds the
+# rendered Mermaid SVGs
+HTML_CACHE_VERSION = '2'
+
+# Font sizes and line height from the font_settings config, with their defaults
+FontSettings = namedtuple(
+    'FontSettings', 'base_font_size line_height h1_size h2_size h3_size code_size',
+    defaults=('12pt', '1.6', '24pt', '20pt', '16pt', '10pt')
+)
+
+def _font_settings_from_dict(font_settings):
+    """Build FontSettings from a font_settings dictionary, ignoring unknown keys"""
+    return FontSettings(**{
+        field: font_settings[field] for field in FontSettings._fields if field in font_settings
+    })
+
+@lru_cache(maxsize=32)
+def _font_css(font_settings):
+    """Build the font override CSS rules for a FontSettings, once per distinct value"""
+    base_font_size, line_height, h1_size, h2_size, h3_size, code_size = font_settings
+    
+    return f"""
+            body {{
+                font-size: {base_font_size} !important;
+                line-height: {line_height} !important;
+            }}
+            h1 {{
+                font-size: {h1_size} !important;
+            }}
+            h2 {{
+                font-size: {h2_size} !important;
+            }}
+            h3, h4, h5, h6 {{
+                font-size: {h3_size} !important;
+            }}
+            code, pre {{
+                font-size: {code_size} !important;
+            }}
+"""
+
+# Default template for a flat list of files (%-style placeholders)
+_DEFAULT_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>%(title)s</title>
+    <style>
+        body { 
+            font-family: Arial, sans-serif; 
+            margin: 20px; 
+            font-size: %(base_font_size)s;
+            line-height: %(line_height)s;
+        }
+        .title-page {
+            text-align: center;
+            margin-bottom: 50px;
+            padding: 50px 0;
+            border-bottom: 2px solid #333;
+        }
+        .title-page h1 {
+            font-size: %(h1_size)s;
+            margin-bottom: 20px;
+            color: #333;
+        }
+        .title-page .author {
+            font-size: %(h2_size)s;
+            color: #666;
+            font-style: italic;
+        }
+        h1 { color: #333; font-size: %(h1_size)s; }
+        h2 { color: #333; font-size: %(h2_size)s; }
+        h3 { color: #333; font-size: %(h3_size)s; }
+        code { 
+            background-color: #f4f4f4; 
+            padding: 2px 4px; 
+            font-size: %(code_size)s;
+        }
+        pre { 
+            background-color: #f4f4f4; 
+            padding: 10px; 
+            overflow-x: auto;
+            font-size: %(code_size)s;
+        }
+    </style>
+    %(font_css)s
+</head>
+<body>
+    <div class="title-page">
+        <h1>%(title)s</h1>
+        <div class="author">by %(author)s</div>
+    </div>
+    {{ content }}
+</body>
+</html>
+"""
+
+# Default template with hierarchical section styling (%-style placeholders)
+_HIERARCHICAL_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>%(title)s</title>
+    <style>
+        body { 
+            font-family: Arial, sans-serif; 
+            margin: 20px; 
+            font-size: %(base_font_size)s;
+            line-height: %(line_height)s;
+        }
+        .title-page {
+            text-align: center;
+            margin-bottom: 50px;
+            padding: 100px 0;
+            border-bottom: 3px solid #333;
+            page-break-after: always;
+        }
+        .title-page h1 {
+            font-size: %(h1_size)s;
+            margin-bottom: 30px;
+            color: #333;
+            border-bottom: none;
+            page-break-before: auto;
+            margin-top: 0;
+        }
+        .title-page .author {
+            font-size: %(h2_size)s;
+            color: #666;
+            font-style: italic;
+            margin-top: 20px;
+        }
+        /* Major section styles */
+        .major-section-header {
+            text-align: center;
+            margin: 60px 0 40px 0;
+            padding: 40px 30px;
+            border-top: 4px solid #007acc;
+            border-bottom: 2px solid #007acc;
+            background: linear-gradient(135deg, #f5f7fa 0%%, #c3cfe2 100%%);
+            page-break-before: always;
+            page-break-after: avoid;
+        }
+        .major-section-title {
+            font-size: calc(%(h1_size)s + 6pt);
+            color: #007acc;
+            margin: 0 0 30px 0;
+            font-weight: bold;
+            text-transform: uppercase;
+            letter-spacing: 3px;
+            text-shadow: 1px 1px 2px rgba(0,0,0,0.1);
+        }
+        /* Table of contents styles for major sections */
+        .major-section-toc {
+            text-align: left;
+            margin-top: 40px;
+            padding: 20px;
+            background-color: rgba(255, 255, 255, 0.8);
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }
+        .toc-item {
+            margin-bottom: 15px;
+        }
+        .toc-section-title {
+            color: #007acc;
+            font-size: %(h3_size)s;
+            margin: 0;
+            font-weight: bold;
+            padding: 10px 15px;
+            background-color: rgba(0, 122, 204, 0.1);
+            border-left: 4px solid #007acc;
+            border-radius: 4px;
+        }
+        /* Subsection styles */
+        .subsection-header {
+            margin: 40px 0 20px 0;
+            padding: 20px 0;
+            border-left: 4px solid #28a745;
+            padding-left: 20px;
+            background-color: #f8f9fa;
+            page-break-after: avoid;
+        }
+        .subsection-title {
+            font-size: %(h1_size)s;
+            color: #28a745;
+            margin: 0;
+            font-weight: bold;
+            letter-spacing: 1px;
+        }
+        /* Regular section styles (backward compatibility) */
+        .section-header {
+            text-align: center;
+            margin: 50px 0;
+            padding: 30px 0;
+            border-top: 3px solid #007acc;
+            border-bottom: 1px solid #ccc;
+            page-break-before: always;
+        }
+        .section-title {
+            font-size: %(h1_size)s;
+            color: #007acc;
+            margin: 0;
+            font-weight: bold;
+            text-transform: uppercase;
+            letter-spacing: 2px;
+        }
+        /* Content styles - Proper hierarchy */
+        h1 { 
+            color: #333; 
+            font-size: %(h1_size)s; 
+            page-break-before: avoid; 
+            margin-top: 30px;
+            margin-bottom: 20px;
+            text-align: center;
+        }
+        h2 { 
+            color: #007acc; 
+            font-size: calc(%(h1_size)s + 4pt);
+            margin-top: 40px;
+            margin-bottom: 25px;
+            border-bottom: 2px solid #007acc;
+            padding-bottom: 10px;
+        }
+        h3 { 
+            color: #28a745; 
+            font-size: %(h1_size)s;
+            margin-top: 30px;
+            margin-bottom: 20px;
+            border-left: 4px solid #28a745;
+            padding-left: 15px;
+        }
+        h4 { 
+            color: #333; 
+            font-size: %(h2_size)s;
+            margin-top: 25px;
+            margin-bottom: 15px;
+            border-bottom: 1px solid #ddd;
+            padding-bottom: 5px;
+            font-weight: bold;
+        }
+        h5 { 
+            color: #555; 
+            font-size: %(h3_size)s;
+            margin-top: 20px;
+            margin-bottom: 10px;
+        }
+        h6 { 
+            color: #666; 
+            font-size: calc(%(h3_size)s - 2pt);
+            margin-top: 15px;
+            margin-bottom: 8px;
+            font-style: italic;
+        }
+        code { 
+            background-color: #f4f4f4; 
+            padding: 2px 4px; 
+            font-size: %(code_size)s;
+        }
+        pre { 
+            background-color: #f4f4f4; 
+            padding: 10px; 
+            overflow-x: auto;
+            font-size: %(code_size)s;
+        }
+    </style>
+    %(font_css)s
+</head>
+<body>
+    <div class="title-page">
+        <h1>%(title)s</h1>
+        <div class="author">by %(author)s</div>
+    </div>
+    {{ content }}
+</body>
+</html>
+"""
+
+# Maximum number of generated default templates kept by PdfExporter
+DEFAULT_TEMPLATE_CACHE_SIZE = 8
+
+# Maximum number of worker processes converting markdown files in parallel
+CONVERT_MAX_WORKERS = 4
+
+# MarkdownProcessor shared by everything converted in this process, and the
+# pid and cache directory it was created for (see _get_processor)
+_processor = None
+_processor_key = None
+
+def _get_processor(cache_dir=None):
+    """
+    Return the process-wide MarkdownProcessor, creating it on first use.
+    
+    A worker forked from a process that already has one gets its own, so
+    Mermaid browser state is never shared across processes. With a cache
+    directory, rendered Mermaid diagrams are cached in its mermaid subfolder.
+    """
+    global _processor, _processor_key
+    processor_key = (os.getpid(), cache_dir)
+    if _processor is None or _processor_key != processor_key:
+        mermaid_cache_dir = os.path.join(cache_dir, 'mermaid') if cache_dir else None
+        _processor = MarkdownProcessor(mermaid_cache_dir)
+        _processor_key = processor_key
+    return _processor
+
+def _convert_markdown_file(processor, md_file, cache_dir=None):
+    """
+    Read a markdown file and convert it to HTML.
+    
+    When cache_dir is set, the HTML is cached on disk under a hash of the
+    markdown content, so unchanged files skip the markdown pipeline on later
+    exports.
+    
+    Args:
+        processor: MarkdownProcessor used on a cache miss
+        md_file: Path to the markdown file
+        cache_dir: Directory for cached HTML (optional)
+        
+    Returns:
+        HTML string for the file
+    """
+    md_content = read_file(md_file)
+    if not cache_dir:
+        return processor.process_markdown(md_content)
+    
+    # The versions are hashed with the content; blake2b's person parameter is
+    # limited to 16 bytes, so it only names the cache
+    digest = hashlib.blake2b(f'{HTML_CACHE_VERSION}\0{MERMAID_CACHE_VERSION}\0'.encode(),
+                             digest_size=16, person=b'md2html')
+    digest.update(md_content.encode('utf-8'))
+    cache_path = os.path.join(cache_dir, f"{digest.hexdigest()}.html")
+    if os.path.exists(cache_path):
+        return read_file(cache_path)
+    
+    mermaid_failures = processor.mermaid_failures
+    file_html = processor.process_markdown(md_content)
+    
+    # Don't cache fallback output for diagrams that failed to render
+    if processor.mermaid_failures == mermaid_failures:
+        # Write to a temporary file first so readers never see a partial entry
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        write_file(temp_path, file_html)
+        os.replace(temp_path, cache_path)
+    return file_html
+
+def _process_markdown_file(md_file, cache_dir=None):
+    """
+    Read a markdown file and convert it to HTML inside a worker process.
+    
+    The processor is created once per worker and reused for every file
+    the worker handles.
+    
+    Returns:
+        Tuple of the HTML string and whether every Mermaid diagram in it
+        rendered (False when it contains fallback code blocks)
+    """
+    processor = _get_processor(cache_dir)
+    mermaid_failures = processor.mermaid_failures
+    file_html = _convert_markdown_file(processor, md_file, cache_dir)
+    return file_html, processor.mermaid_failures == mermaid_failures
+
+def _convert_in_workers(md_files, cache_dir=None):
+    """
+    Convert markdown files to HTML in a pool of worker processes.
+    
+    The pool has at most CONVERT_MAX_WORKERS workers, since each worker
+    launches its own headless Chromium for the Mermaid diagrams of its files.
+    Workers are forked, unless this process already runs the Mermaid
+    renderer's event loop thread (e.g. after converting a single file in an
+    earlier export); then they are spawned fresh instead of copying it.
+    
+    Args:
+        md_files: Paths of the markdown files to convert
+        cache_dir: Directory for cached HTML (optional)
+        
+    Returns:
+        List of (HTML string, whether every Mermaid diagram rendered) tuples
+        in the order of md_files
+    """
+    max_workers = min(len(md_files), os.cpu_count() or 1, CONVERT_MAX_WORKERS)
+    mp_context = multiprocessing.get_context('spawn') if shared_renderer_running() else None
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        return list(executor.map(_process_markdown_file, md_files, repeat(cache_dir)))
+
 class PdfExporter:
+    # Generated default templates shared by all exporters, keyed by builder,
+    # title, author and font settings
+    _default_template_cache = {}
+
+    # (FontConfiguration, [CSS]) shared by exporters using the same unchanged
+    # stylesheet, keyed by (absolute path, mtime)
+    _stylesheet_cache = {}
+
     def __init__(self, config):
         self.config = config
         self.template_path = config.get('template')
         self.css_path = config.get('css')
+        self.cache_dir = config.get('cache_dir')
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        # Images decoded by WeasyPrint, reused by every export from this instance
+        self.image_cache = {}
+        
+        # Font settings resolved once; None when the config does not set any
+        font_settings = config.get('font_settings')
+        self._fonts = _font_settings_from_dict(font_settings) if font_settings else None
+        
+        # Font configuration and parsed stylesheet shared by every export from this instance
+        self.font_config, self.stylesheets = self._load_stylesheets()
+        
+        # Converted HTML reused across export calls, keyed by absolute path with
+        # the (absolute path, mtime, size) key it was converted at; a changed
+        # file replaces its entry, so there is one entry per file
+        self._md_cache = {}
+        # (mtime, contents) of the template file from the last export
+        self._template_file_cache = None
+        # Font settings parsed as a stylesheet for template files, created on first use
+        self._font_stylesheet = None
+
+    def _load_stylesheets(self):
+        """
+        Parse the configured stylesheet, reusing the result of an earlier
+        exporter when the file has not changed since.
+        
+        Returns:
+            Tuple of the FontConfiguration and the list of parsed stylesheets
+            to pass to write_pdf (empty when there is no stylesheet)
+        """
+        try:
+            key = (os.path.abspath(self.css_path), os.stat(self.css_path).st_mtime_ns) if self.css_path else None
+        except FileNotFoundError:
+            key = None
+        if key is None:
+            return FontConfiguration(), []
+        
+        cached = self._stylesheet_cache.get(key)
+        if cached is None:
+            font_config = FontConfiguration()
+            cached = (font_config, [CSS(filename=self.css_path, font_config=font_config)])
+            self._stylesheet_cache[key] = cached
+        return cached
+
+    def _md_cache_key(self, md_file):
+        """Build the in-memory cache key for a markdown file from its stat info"""
+        st = os.stat(md_file)
+        return (os.path.abspath(md_file), st.st_mtime_ns, st.st_size)
 
     def export_to_pdf(self, markdown_files, output_path):
-        # Initialize the Markdown processor
-        processor = MarkdownProcessor()
+        # Convert the Markdown files to HTML in parallel
+        converted = self._convert_files(markdown_files)
 
-        # Process each Markdown file and convert to HTML
-        html_content = ""
+        # Assemble the HTML in the original file order
+        html_parts = []
         for md_file in markdown_files:
-            if os.path.exists(md_file):
-                with open(md_file, 'r', encoding='utf-8') as file:
-                    md_content = file.read()
-                html_content += processor.process_markdown(md_content) + "<div style='page-break-after: always;'></div>"
-            else:
+            file_html = converted.get(md_file)
+            if file_html is None:
                 print(f"Warning: Markdown file not found: {md_file}")
                 continue
+            html_parts.append(file_html)
+            html_parts.append(_FILE_PAGE_BREAK)
 
-        # Load the HTML template
-        if self.template_path and os.path.exists(self.template_path):
-            with open(self.template_path, 'r', encoding='utf-8') as template_file:
-                template = template_file.read()
-            
-            # Replace template variables with actual values
-            title = self.config.get('title', 'Title of the Book')
-            author = self.config.get('author', 'Author Name')
-            template = template.replace('{{ title }}', title)
-            template = template.replace('{{ author }}', author)
-        else:
-            # Use default template
-            font_settings = self.config.get('font_settings', {})
-            base_font_size = font_settings.get('base_font_size', '12pt')
-            line_height = font_settings.get('line_height', '1.6')
-            h1_size = font_settings.get('h1_size', '24pt')
-            h2_size = font_settings.get('h2_size', '20pt')
-            h3_size = font_settings.get('h3_size', '16pt')
-            code_size = font_settings.get('code_size', '10pt')
-            
-            # Get title and author from config, with fallbacks
-            title = self.config.get('title', 'Title of the Book')
-            author = self.config.get('author', 'Author Name')
-            
-            template = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>{title}</title>
-                <style>
-                    body {{ 
-                        font-family: Arial, sans-serif; 
-                        margin: 20px; 
-                        font-size: {base_font_size};
-                        line-height: {line_height};
-                    }}
-                    .title-page {{
-                        text-align: center;
-                        margin-bottom: 50px;
-                        padding: 50px 0;
-                        border-bottom: 2px solid #333;
-                    }}
-                    .title-page h1 {{
-                        font-size: {h1_size};
-                        margin-bottom: 20px;
-                        color: #333;
-                    }}
-                    .title-page .author {{
-                        font-size: {h2_size};
-                        color: #666;
-                        font-style: italic;
-                    }}
-                    h1 {{ color: #333; font-size: {h1_size}; }}
-                    h2 {{ color: #333; font-size: {h2_size}; }}
-                    h3 {{ color: #333; font-size: {h3_size}; }}
-                    code {{ 
-                        background-color: #f4f4f4; 
-                        padding: 2px 4px; 
-                        font-size: {code_size};
-                    }}
-                    pre {{ 
-                        background-color: #f4f4f4; 
-                        padding: 10px; 
-                        overflow-x: auto;
-                        font-size: {code_size};
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="title-page">
-                    <h1>{title}</h1>
-                    <div class="author">by {author}</div>
-                </div>
-                {{{{ content }}}}
-            </body>
-            </html>
-            """
-
-        # Apply font settings to existing template if configured
-        font_settings = self.config.get('font_settings', {})
-        if font_settings:
-            template = self.apply_font_settings_to_template(template, font_settings)
-
-        # Combine the template with the HTML content
-        final_html = template.replace("{{ content }}", html_content)
-
-        # Generate the PDF with CSS if available
-        html_doc = HTML(string=final_html)
-        if self.css_path and os.path.exists(self.css_path):
-            html_doc.write_pdf(output_path, stylesheets=[self.css_path])
-        else:
-            html_doc.write_pdf(output_path)
+        # Don't start WeasyPrint for a book without any content
+        if not html_parts:
+            print("Warning: No markdown content to export; PDF was not generated.")
+            return False
 
-        print(f"PDF successfully generated: {output_path}")
+        self._write_pdf(html_parts, output_path, self._generate_default_template)
+        return True
 
     def export_to_pdf_with_sections(self, sections_with_files, output_path):
         """
@@ -126,77 +526,76 @@ class PdfExporter:
         Args:
             sections_with_files: List of dictionaries with 'title', 'type', and 'files' keys
             output_path: Output PDF file path
+            
+        Returns:
+            True if the PDF was generated, False if none of the files exist
         """
-        # Initialize the Markdown processor
-        processor = MarkdownProcessor()
-
         # Get source root from config to resolve file paths
         source_root = self.config.get('source_root', '')
         missing_files = []
 
-        # Process each section and its files
-        html_content = ""
+        # Convert the files of every section in parallel up front
+        converted = self._convert_files([
+            md_file
+            for section_info in sections_with_files
+            for md_file in section_info.get('files', [])
+        ])
+
+        # Process each section and its files, collecting the HTML fragments in order
+        html_parts = []
         
-        for section_info in sections_with_files:
-            section_title = section_info.get('title', 'Untitled Section')
+        for index, section_info in enumerate(sections_with_files):
+            section_title = _escape_html(section_info.get('title', 'Untitled Section'))
             section_type = section_info.get('type', 'section')
             section_files = section_info.get('files', [])
             
             # Add appropriate section header based on type
             if section_type == 'major_section':
                 # Major section header (H2 level - under book title H1) with table of contents
-                toc_html = ""
-                if 'toc' in section_info and section_info['toc']:
-                    toc_html = "<div class='major-section-toc'>"
-                    for toc_item in section_info['toc']:
-                        toc_html += f"""
-                        <div class='toc-item'>
-                            <div class='toc-section-title'>{toc_item['number']}. {toc_item['title']}</div>
-                        </div>
-                        """
-                    toc_html += "</div>"
-                
-                html_content += f"""
-                <div class="major-section-header">
-                    <h2 class="major-section-title">{section_title}</h2>
-                    {toc_html}
-                </div>
-                """
+                toc_items = [
+                    _TOC_ITEM % (toc_item['number'], _escape_html(toc_item['title']))
+                    for toc_item in section_info.get('toc') or ()
+                ]
+                toc_html = _TOC % "".join(toc_items) if toc_items else ""
+                html_parts.append(_MAJOR_SECTION_HEADER % (section_title, toc_html))
             elif section_type == 'subsection':
                 # Subsection header (H3 level - under major section H2)
-                html_content += f"""
-                <div class="subsection-header">
-                    <h3 class="subsection-title">{section_title}</h3>
-                </div>
-                """
+                html_parts.append(_SUBSECTION_HEADER % section_title)
             else:
                 # Regular section header (backward compatibility - H2 level)
-                html_content += f"""
-                <div class="section-header">
-                    <h2 class="section-title">{section_title}</h2>
-                </div>
-                """
+                html_parts.append(_SECTION_HEADER % section_title)
             
             # Process each file in the section (only if there are files)
             if section_files:
+                # The break after the section's last file is left out when
+                # what follows starts a new page anyway: the major section
+                # break, a page-breaking section header or the end of the book
+                if section_type == 'major_section' or index + 1 == len(sections_with_files):
+                    break_after_last = False
+                else:
+                    next_type = sections_with_files[index + 1].get('type', 'section')
+                    break_after_last = next_type not in _PAGE_BREAKING_SECTION_TYPES
+                
+                file_count = 0
                 for md_file in section_files:
-                    if os.path.exists(md_file):
-                        with open(md_file, 'r', encoding='utf-8') as file:
-                            md_content = file.read()
-                        
-                        # Process markdown and add to content
-                        file_html = processor.process_markdown(md_content)
-                        html_content += file_html
-                        
-                        # Add page break after each file (optional)
-                        html_content += "<div style='page-break-after: always;'></div>"
+                    file_html = converted.get(md_file)
+                    if file_html is not None:
+                        # Add page break between files
+                        if file_count:
+                            html_parts.append(_FILE_PAGE_BREAK)
+                        # Add the converted markdown to content
+                        html_parts.append(file_html)
+                        file_count += 1
                     else:
                         missing_files.append(md_file)
                         continue
+                
+                if file_count and break_after_last:
+                    html_parts.append(_FILE_PAGE_BREAK)
             
             # Add section break for major sections (new page for next major section)
             if section_type == 'major_section':
-                html_content += "<div style='page-break-before: always;'></div>"
+                html_parts.append(_MAJOR_SECTION_BREAK)
 
         # Report missing files
         if missing_files:
@@ -206,229 +605,218 @@ class PdfExporter:
             print(f"Source root: {source_root}")
             print(f"Current working directory: {os.getcwd()}")
 
+        # Don't start WeasyPrint when no file could be converted (headers only)
+        if not converted:
+            print("Warning: No markdown content to export; PDF was not generated.")
+            return False
+
+        # Use the default template with hierarchical sections support when no template file is set
+        self._write_pdf(html_parts, output_path, self._generate_default_template_with_hierarchical_sections)
+
+        if missing_files:
+            print(f"Note: {len(missing_files)} files were missing and not included in the PDF.")
+        return True
+    
+    def _write_pdf(self, html_parts, output_path, default_generator):
+        """
+        Fill the template with the book body and generate the PDF.
+        
+        Args:
+            html_parts: Rendered HTML fragments for the book body, in order
+            output_path: Output PDF file path
+            default_generator: Default template generator used when no
+                template file is configured
+        """
         # Load the HTML template
-        if self.template_path and os.path.exists(self.template_path):
-            with open(self.template_path, 'r', encoding='utf-8') as template_file:
-                template = template_file.read()
-            
-            # Replace template variables with actual values
+        stylesheets = self.stylesheets
+        template = self._load_template_file()
+        if template is None:
+            # The default templates have the font settings CSS built in
             title = self.config.get('title', 'Title of the Book')
             author = self.config.get('author', 'Author Name')
-            template = template.replace('{{ title }}', title)
-            template = template.replace('{{ author }}', author)
-        else:
-            # Use default template with hierarchical sections support
-            title = self.config.get('title', 'Title of the Book')
-            author = self.config.get('author', 'Author Name')
-            font_settings = self.config.get('font_settings', {})
-            template = self._generate_default_template_with_hierarchical_sections(title, author, font_settings)
+            template = self._get_default_template(default_generator, title, author, self._fonts)
+        elif self._fonts:
+            # A template file gets the font settings as an extra stylesheet
+            stylesheets = stylesheets + [self._get_font_stylesheet()]
+
+        # Fill in the content as encoded bytes
+        html_bytes = self._render_template(template, html_parts)
 
-        # Apply font settings to existing template if configured
-        font_settings = self.config.get('font_settings', {})
-        if font_settings:
-            template = self.apply_font_settings_to_template(template, font_settings)
+        # Generate the PDF with the pre-parsed stylesheet and shared font configuration,
+        # into a temporary file first so a failed export never leaves a partial PDF
+        html_doc = HTML(file_obj=html_bytes, encoding='utf-8')
+        # The document is parsed on construction; release the encoded copy before layout
+        html_bytes.close()
+        del html_bytes
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            html_doc.write_pdf(temp_path, stylesheets=stylesheets, font_config=self.font_config,
+                               cache=self.image_cache)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        print(f"PDF successfully generated: {output_path}")
 
-        # Combine the template with the HTML content
-        final_html = template.replace("{{ content }}", html_content)
+    def _get_font_stylesheet(self):
+        """Return the parsed font settings stylesheet, parsing it on first use"""
+        if self._font_stylesheet is None:
+            self._font_stylesheet = CSS(string=_font_css(self._fonts), font_config=self.font_config)
+        return self._font_stylesheet
 
-        # Generate the PDF with CSS if available
-        html_doc = HTML(string=final_html)
-        if self.css_path and os.path.exists(self.css_path):
-            html_doc.write_pdf(output_path, stylesheets=[self.css_path])
+    def _convert_files(self, md_files):
+        """
+        Convert markdown files to HTML, skipping files that do not exist.
+        
+        Each file is stat'ed once. Files that are not in the in-memory cache
+        are converted once each, through a bounded process pool when there
+        are several of them and in this process otherwise. HTML with fallback
+        code blocks for diagrams that failed to render is not cached, so the
+        next export tries them again.
+        
+        Args:
+            md_files: Paths of markdown files
+            
+        Returns:
+            Dictionary mapping each existing path in md_files to its HTML
+        """
+        file_keys = {}
+        pending = {}
+        for md_file in md_files:
+            if md_file in file_keys:
+                continue
+            try:
+                key = self._md_cache_key(md_file)
+            except FileNotFoundError:
+                continue
+            file_keys[md_file] = key
+            cached = self._md_cache.get(key[0])
+            if (cached is None or cached[0] != key) and key not in pending:
+                pending[key] = md_file
+        
+        if len(pending) == 1:
+            # Not worth starting worker processes for a single file
+            converted = [_process_markdown_file(md_file, self.cache_dir) for md_file in pending.values()]
+        elif pending:
+            converted = _convert_in_workers(list(pending.values()), self.cache_dir)
         else:
-            html_doc.write_pdf(output_path)
+            converted = []
+        
+        fresh = {}
+        for key, (file_html, complete) in zip(pending.keys(), converted):
+            fresh[key] = file_html
+            if complete:
+                self._md_cache[key[0]] = (key, file_html)
+            else:
+                # Drop the file's older entry as well; it no longer matches the file
+                self._md_cache.pop(key[0], None)
+        return {md_file: fresh[key] if key in fresh else self._md_cache[key[0]][1]
+                for md_file, key in file_keys.items()}
 
-        print(f"PDF successfully generated: {output_path}")
-        if missing_files:
-            print(f"Note: {len(missing_files)} files were missing and not included in the PDF.")
+    def _load_template_file(self):
+        """
+        Read the configured template file, reusing the contents while its
+        mtime is unchanged.
+        
+        Returns:
+            Template string, or None if no template file is configured or it
+            does not exist
+        """
+        if not self.template_path:
+            return None
+        try:
+            key = os.stat(self.template_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if self._template_file_cache is None or self._template_file_cache[0] != key:
+            with open(self.template_path, 'r', encoding='utf-8') as template_file:
+                self._template_file_cache = (key, template_file.read())
+        return self._template_file_cache[1]
+
+    def _get_default_template(self, generator, title, author, font_settings):
+        """
+        Return a default template, generating it only the first time a given
+        title, author and font settings combination is used.
+        
+        Args:
+            generator: Template generator method
+            title: Book title
+            author: Book author
+            font_settings: Resolved FontSettings, or None when the config has none
+            
+        Returns:
+            Template string with the content placeholder
+        """
+        key = (generator.__name__, title, author, font_settings)
+        template = self._default_template_cache.get(key)
+        if template is None:
+            if len(self._default_template_cache) >= DEFAULT_TEMPLATE_CACHE_SIZE:
+                self._default_template_cache.clear()
+            template = generator(title, author, font_settings)
+            self._default_template_cache[key] = template
+        return template
+
+    def _generate_default_template(self, title, author, font_settings):
+        """Generate the default template for a flat list of files"""
+        font_css = self.build_font_css(font_settings) if font_settings else ''
+        return _DEFAULT_TEMPLATE % dict(
+            (font_settings or FontSettings())._asdict(),
+            title=_escape_html(title), author=_escape_html(author), font_css=font_css
+        )
     
     def _generate_default_template_with_hierarchical_sections(self, title, author, font_settings):
         """Generate default template with hierarchical section styling support"""
-        base_font_size = font_settings.get('base_font_size', '12pt')
-        line_height = font_settings.get('line_height', '1.6')
-        h1_size = font_settings.get('h1_size', '24pt')
-        h2_size = font_settings.get('h2_size', '20pt')
-        h3_size = font_settings.get('h3_size', '16pt')
-        code_size = font_settings.get('code_size', '10pt')
+        font_css = self.build_font_css(font_settings) if font_settings else ''
+        return _HIERARCHICAL_TEMPLATE % dict(
+            (font_settings or FontSettings())._asdict(),
+            title=_escape_html(title), author=_escape_html(author), font_css=font_css
+        )
+
+    def _render_template(self, template, content_parts):
+        """
+        Fill the template placeholders in a single pass.
         
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{title}</title>
-            <style>
-                body {{ 
-                    font-family: Arial, sans-serif; 
-                    margin: 20px; 
-                    font-size: {base_font_size};
-                    line-height: {line_height};
-                }}
-                .title-page {{
-                    text-align: center;
-                    margin-bottom: 50px;
-                    padding: 100px 0;
-                    border-bottom: 3px solid #333;
-                    page-break-after: always;
-                }}
-                .title-page h1 {{
-                    font-size: {h1_size};
-                    margin-bottom: 30px;
-                    color: #333;
-                    border-bottom: none;
-                    page-break-before: auto;
-                    margin-top: 0;
-                }}
-                .title-page .author {{
-                    font-size: {h2_size};
-                    color: #666;
-                    font-style: italic;
-                    margin-top: 20px;
-                }}
-                /* Major section styles */
-                .major-section-header {{
-                    text-align: center;
-                    margin: 60px 0 40px 0;
-                    padding: 40px 30px;
-                    border-top: 4px solid #007acc;
-                    border-bottom: 2px solid #007acc;
-                    background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-                    page-break-before: always;
-                    page-break-after: avoid;
-                }}
-                .major-section-title {{
-                    font-size: calc({h1_size} + 6pt);
-                    color: #007acc;
-                    margin: 0 0 30px 0;
-                    font-weight: bold;
-                    text-transform: uppercase;
-                    letter-spacing: 3px;
-                    text-shadow: 1px 1px 2px rgba(0,0,0,0.1);
-                }}
-                /* Table of contents styles for major sections */
-                .major-section-toc {{
-                    text-align: left;
-                    margin-top: 40px;
-                    padding: 20px;
-                    background-color: rgba(255, 255, 255, 0.8);
-                    border-radius: 8px;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                }}
-                .toc-item {{
-                    margin-bottom: 15px;
-                }}
-                .toc-section-title {{
-                    color: #007acc;
-                    font-size: {h3_size};
-                    margin: 0;
-                    font-weight: bold;
-                    padding: 10px 15px;
-                    background-color: rgba(0, 122, 204, 0.1);
-                    border-left: 4px solid #007acc;
-                    border-radius: 4px;
-                }}
-                /* Subsection styles */
-                .subsection-header {{
-                    margin: 40px 0 20px 0;
-                    padding: 20px 0;
-                    border-left: 4px solid #28a745;
-                    padding-left: 20px;
-                    background-color: #f8f9fa;
-                    page-break-after: avoid;
-                }}
-                .subsection-title {{
-                    font-size: {h1_size};
-                    color: #28a745;
-                    margin: 0;
-                    font-weight: bold;
-                    letter-spacing: 1px;
-                }}
-                /* Regular section styles (backward compatibility) */
-                .section-header {{
-                    text-align: center;
-                    margin: 50px 0;
-                    padding: 30px 0;
-                    border-top: 3px solid #007acc;
-                    border-bottom: 1px solid #ccc;
-                    page-break-before: always;
-                }}
-                .section-title {{
-                    font-size: {h1_size};
-                    color: #007acc;
-                    margin: 0;
-                    font-weight: bold;
-                    text-transform: uppercase;
-                    letter-spacing: 2px;
-                }}
-                /* Content styles - Proper hierarchy */
-                h1 {{ 
-                    color: #333; 
-                    font-size: {h1_size}; 
-                    page-break-before: avoid; 
-                    margin-top: 30px;
-                    margin-bottom: 20px;
-                    text-align: center;
-                }}
-                h2 {{ 
-                    color: #007acc; 
-                    font-size: calc({h1_size} + 4pt);
-                    margin-top: 40px;
-                    margin-bottom: 25px;
-                    border-bottom: 2px solid #007acc;
-                    padding-bottom: 10px;
-                }}
-                h3 {{ 
-                    color: #28a745; 
-                    font-size: {h1_size};
-                    margin-top: 30px;
-                    margin-bottom: 20px;
-                    border-left: 4px solid #28a745;
-                    padding-left: 15px;
-                }}
-                h4 {{ 
-                    color: #333; 
-                    font-size: {h2_size};
-                    margin-top: 25px;
-                    margin-bottom: 15px;
-                    border-bottom: 1px solid #ddd;
-                    padding-bottom: 5px;
-                    font-weight: bold;
-                }}
-                h5 {{ 
-                    color: #555; 
-                    font-size: {h3_size};
-                    margin-top: 20px;
-                    margin-bottom: 10px;
-                }}
-                h6 {{ 
-                    color: #666; 
-                    font-size: calc({h3_size} - 2pt);
-                    margin-top: 15px;
-                    margin-bottom: 8px;
-                    font-style: italic;
-                }}
-                code {{ 
-                    background-color: #f4f4f4; 
-                    padding: 2px 4px; 
-                    font-size: {code_size};
-                }}
-                pre {{ 
-                    background-color: #f4f4f4; 
-                    padding: 10px; 
-                    overflow-x: auto;
-                    font-size: {code_size};
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="title-page">
-                <h1>{title}</h1>
-                <div class="author">by {author}</div>
-            </div>
-            {{{{ content }}}}
-        </body>
-        </html>
+        Replaces {{ title }}, {{ author }} and {{ content }} (with any spacing
+        inside the braces), scanning the template only once. Title and author are escaped as HTML text, or as
+        CSS string content inside a <style> element (e.g. page header rules).
+        The document is encoded piece by piece straight into the returned
+        buffer, so the full HTML never exists as one str.
+        
+        Args:
+            template: HTML template string
+            content_parts: Rendered HTML fragments for the book body, in order
+            
+        Returns:
+            BytesIO holding the UTF-8 encoded final document, rewound to the start
         """
+        replacements = {
+            'title': str(self.config.get('title', 'Title of the Book')),
+            'author': str(self.config.get('author', 'Author Name')),
+        }
+        
+        buffer = io.BytesIO()
+        position = 0
+        in_style = False
+        for match in _TEMPLATE_SLOT_RE.finditer(template):
+            buffer.write(template[position:match.start()].encode('utf-8'))
+            name = match.group(1)
+            if name == 'content':
+                for part in content_parts:
+                    buffer.write(part.encode('utf-8'))
+            elif name is not None:
+                escape_table = _CSS_STRING_ESCAPE if in_style else _HTML_ESCAPE
+                buffer.write(replacements[name].translate(escape_table).encode('utf-8'))
+            else:
+                # Style tag, kept as written
+                tag = match.group(0)
+                in_style = tag[1] != '/'
+                buffer.write(tag.encode('utf-8'))
+            position = match.end()
+        buffer.write(template[position:].encode('utf-8'))
+        buffer.seek(0)
+        return buffer
 
     def apply_font_settings_to_template(self, template, font_settings):
         """
@@ -441,46 +829,27 @@ class PdfExporter:
         Returns:
             Modified template with font settings applied
         """
-        base_font_size = font_settings.get('base_font_size', '12pt')
-        line_height = font_settings.get('line_height', '1.6')
-        h1_size = font_settings.get('h1_size', '24pt')
-        h2_size = font_settings.get('h2_size', '20pt')
-        h3_size = font_settings.get('h3_size', '16pt')
-        code_size = font_settings.get('code_size', '10pt')
+        # Nothing to inject without font settings
+        if not font_settings:
+            return template
         
-        # CSS to inject
-        font_css = f"""
-        <style>
-            body {{
-                font-size: {base_font_size} !important;
-                line-height: {line_height} !important;
-            }}
-            h1 {{
-                font-size: {h1_size} !important;
-            }}
-            h2 {{
-                font-size: {h2_size} !important;
-            }}
-            h3 {{
-                font-size: {h3_size} !important;
-            }}
-            h4, h5, h6 {{
-                font-size: {h3_size} !important;
-            }}
-            code {{
-                font-size: {code_size} !important;
-            }}
-            pre {{
-                font-size: {code_size} !important;
-            }}
-            pre code {{
-                font-size: {code_size} !important;
-            }}
-        </style>
-        """
+        font_css = self.build_font_css(font_settings)
         
-        # Insert CSS before closing head tag
-        if '</head>' in template:
-            template = template.replace('</head>', font_css + '\n</head>')
+        # Insert CSS before the closing head tag (a template without one is returned unchanged)
+        return _HEAD_RE.sub(lambda match: font_css + '\n' + match.group(0), template, count=1)
+
+    def build_font_css(self, font_settings):
+        """
+        Build the CSS block that overrides font sizes with the configured values.
         
-        return template
\ No newline at end of file
+        Args:
+            font_settings: FontSettings or dictionary with font configuration
+            
+        Returns:
+            <style> block as a string
+        """
+        if not isinstance(font_settings, FontSettings):
+            font_settings = _font_settings_from_dict(font_settings)
+        return f"""
+        <style>{_font_css(font_settings)}        </style>
+        """
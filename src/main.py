@@ -1,11 +1,56 @@
 # markdown-to-pdf-exporter/src/main.py
 
 import os
+import re
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import yaml
-from exporters.pdf_exporter import PdfExporter
 from utils.config_loader import load_config, resolve_paths, resolve_book_structure_paths
 
+# Use the libyaml-backed dumper when PyYAML was built with it
+try:
+    from yaml import CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeDumper as _YamlDumper
+
+# Project root (the parent of src/), where config/ and output/ live
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Splits text into alternating non-digit and digit runs for natural_sort_key
+_SPLIT_NUMBERS = re.compile(r'([0-9]+)').split
+
+# Minimum number of docs subdirectories before they are scanned in parallel
+_PARALLEL_SCAN_MIN_DIRS = 4
+
+# Font size presets for generate_export_config
+_FONT_PRESETS = {
+    'small': {
+        'base_font_size': '10pt',
+        'line_height': '1.5',
+        'h1_size': '20pt',
+        'h2_size': '16pt',
+        'h3_size': '14pt',
+        'code_size': '9pt'
+    },
+    'medium': {
+        'base_font_size': '12pt',
+        'line_height': '1.6',
+        'h1_size': '24pt',
+        'h2_size': '20pt',
+        'h3_size': '16pt',
+        'code_size': '10pt'
+    },
+    'large': {
+        'base_font_size': '14pt',
+        'line_height': '1.7',
+        'h1_size': '28pt',
+        'h2_size': '24pt',
+        'h3_size': '18pt',
+        'code_size': '12pt'
+    }
+}
+
 def scan_markdown_files(root_path, exclude_folders=None):
     """
     Scan a directory for markdown files and organize them by structure.
@@ -15,58 +60,158 @@ def scan_markdown_files(root_path, exclude_folders=None):
         exclude_folders: List of folder paths to exclude (relative to root_path)
         
     Returns:
-        List of markdown files organized by directory structure
+        List of markdown file paths relative to root_path, in directory
+        listing order (generate_book_structure does the sorting)
     """
     markdown_files = []
     docs_path = os.path.join(root_path, 'docs')
     
-    if not os.path.exists(docs_path):
-        print(f"Warning: docs directory not found at {docs_path}")
-        return []
-    
     # Convert exclude_folders to absolute paths for comparison
     exclude_paths = []
     if exclude_folders:
         for folder in exclude_folders:
             # Handle both relative and absolute paths
             if os.path.isabs(folder):
-                exclude_paths.append(folder)
+                exclude_paths.append(os.path.abspath(folder))
             else:
-                exclude_paths.append(os.path.join(root_path, folder))
-    
-    # Walk through the docs directory
-    for root, dirs, files in os.walk(docs_path):
-        # Check if current directory should be excluded
-        should_exclude = False
-        for exclude_path in exclude_paths:
-            if os.path.abspath(root).startswith(os.path.abspath(exclude_path)):
-                should_exclude = True
-                break
-        
-        if should_exclude:
-            print(f"Excluding directory: {root}")
-            continue
-        
-        # Sort directories and files for consistent ordering
-        dirs.sort()
-        files.sort()
+                exclude_paths.append(os.path.abspath(os.path.join(root_path, folder)))
+    
+    # List the docs directory itself, then walk its subdirectories; with
+    # enough of them, the subtrees are walked concurrently since scandir
+    # releases the GIL while it waits on the filesystem
+    section_dirs = []
+    if not _scan_directory(root_path, os.path.abspath(docs_path), 'docs', exclude_paths, markdown_files, section_dirs):
+        print(f"Warning: docs directory not found at {docs_path}")
+        return []
+    if len(section_dirs) < _PARALLEL_SCAN_MIN_DIRS:
+        _walk_markdown_tree(root_path, section_dirs, exclude_paths, markdown_files)
+    else:
+        with ThreadPoolExecutor(max_workers=min(32, len(section_dirs))) as executor:
+            subtrees = executor.map(
+                lambda section_dir: _walk_markdown_tree(root_path, [section_dir], exclude_paths, []),
+                section_dirs
+            )
+            for subtree_files in subtrees:
+                markdown_files.extend(subtree_files)
+    
+    return markdown_files
+
+def _walk_markdown_tree(root_path, pending_dirs, exclude_paths, markdown_files):
+    """
+    Walk directory trees depth-first and collect their markdown files.
+    
+    Args:
+        root_path: Root directory that collected paths are relative to
+        pending_dirs: Stack of (absolute path, path relative to root_path)
+            tuples to walk; consumed in place
+        exclude_paths: Absolute paths of excluded directories
+        markdown_files: List the relative markdown file paths are added to
         
-        for file in files:
-            if file.endswith('.md'):
-                relative_path = os.path.relpath(os.path.join(root, file), root_path)
-                markdown_files.append(relative_path)
+    Returns:
+        markdown_files
+    """
+    while pending_dirs:
+        directory, relative_directory = pending_dirs.pop()
+        _scan_directory(root_path, directory, relative_directory, exclude_paths, markdown_files, pending_dirs)
+    return markdown_files
+
+def _scan_directory(root_path, directory, relative_directory, exclude_paths, markdown_files, pending_dirs):
+    """
+    List one directory for scan_markdown_files.
+    
+    scandir reports each entry's type from the directory listing, so
+    non-markdown files are never stat'ed. Paths are extended by plain
+    concatenation instead of join/abspath/relpath calls.
     
-    return sorted(markdown_files)
+    Args:
+        root_path: Root directory that collected paths are relative to
+        directory: Absolute path of the directory
+        relative_directory: The same directory relative to root_path
+        exclude_paths: Absolute paths of excluded directories
+        markdown_files: List markdown files in the directory are added to
+        pending_dirs: List subdirectories are added to as (absolute path,
+            relative path) tuples
+            
+    Returns:
+        bool: False if the directory could not be listed, True otherwise
+    """
+    # Skip excluded directories along with everything below them
+    if any(directory.startswith(exclude_path) for exclude_path in exclude_paths):
+        print(f"Excluding directory: {os.path.join(root_path, relative_directory)}")
+        return True
+    
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as os.walk does
+        return False
+    with entries:
+        for entry in entries:
+            if entry.is_dir():
+                # Like os.walk, symlinked directories are listed but not followed
+                if not entry.is_symlink():
+                    pending_dirs.append((entry.path, relative_directory + os.sep + entry.name))
+            elif entry.name.endswith('.md'):
+                markdown_files.append(relative_directory + os.sep + entry.name)
+    return True
 
 def natural_sort_key(text):
     """
     Generate a key for natural sorting that handles numbers correctly.
     This will sort "1", "2", "10" instead of "1", "10", "2".
     """
-    import re
-    def convert(text):
-        return int(text) if text.isdigit() else text.lower()
-    return [convert(c) for c in re.split('([0-9]+)', text)]
+    # Lowercasing never touches the digit runs, so it is done once up front
+    return [int(c) if c.isdigit() else c for c in _SPLIT_NUMBERS(text.lower())]
+
+@lru_cache(maxsize=1024)
+def _major_section_title(major_section_dir):
+    """
+    Derive the ordering number and title of a major section directory.
+    
+    Cached per directory name, since every file of a section shares it.
+    
+    Args:
+        major_section_dir: Directory name (e.g., "1-cs-전공-지식")
+        
+    Returns:
+        Tuple of (ordering number or "", uppercase title)
+    """
+    major_order = ""
+    if '-' in major_section_dir:
+        major_parts = major_section_dir.split('-', 1)  # Split only once to separate number and title
+        if len(major_parts) >= 2:
+            major_order = major_parts[0]  # Store ordering number
+            major_title = major_parts[1].replace('-', ' ').upper()  # Convert to uppercase
+        else:
+            major_title = major_section_dir.replace('-', ' ').upper()
+    else:
+        major_title = major_section_dir.replace('-', ' ').upper()
+    return major_order, major_title
+
+@lru_cache(maxsize=1024)
+def _minor_section_title(minor_section_dir):
+    """
+    Derive the ordering number and title of a minor section directory.
+    
+    Cached per directory name, since every file of a subsection shares it.
+    
+    Args:
+        minor_section_dir: Directory name (e.g., "1-1-운영체제")
+        
+    Returns:
+        Tuple of (ordering number or "", title-cased title)
+    """
+    minor_order = ""
+    if '-' in minor_section_dir:
+        minor_parts = minor_section_dir.split('-', 2)  # Split at most 2 times
+        if len(minor_parts) >= 3:
+            minor_order = minor_parts[1]  # Store ordering number
+            minor_title = minor_parts[2].replace('-', ' ').title()
+        else:
+            minor_title = minor_section_dir.replace('-', ' ').title()
+    else:
+        minor_title = minor_section_dir.replace('-', ' ').title()
+    return minor_order, minor_title
 
 def generate_book_structure(root_path, markdown_files, title=None, author=None):
     """
@@ -83,44 +228,31 @@ def generate_book_structure(root_path, markdown_files, title=None, author=None):
     """
     sections = {}
     
-    for file_path in markdown_files:
-        # Extract section and subsection from path
-        parts = file_path.split(os.sep)
+    # Sort once up front; every section and subsection file list below is
+    # filled in this order, so it needs no sort of its own. Paths that
+    # natural-sort equal (e.g. differing only in case) fall back to plain
+    # string order, so the result does not depend on directory listing order
+    for file_path in sorted(markdown_files, key=lambda path: (natural_sort_key(path), path)):
+        # Extract section and subsection from path; only the first three
+        # components are needed, so the rest of the path is left unsplit
+        parts = file_path.split(os.sep, 3)
         if len(parts) >= 3 and parts[0] == 'docs':
             # Extract major section (e.g., "1-cs-전공-지식" -> "CS 전공 지식")
-            major_section_dir = parts[1]
-            major_order = ""
-            if '-' in major_section_dir:
-                major_parts = major_section_dir.split('-', 1)  # Split only once to separate number and title
-                if len(major_parts) >= 2:
-                    major_order = major_parts[0]  # Store ordering number
-                    major_title = major_parts[1].replace('-', ' ').upper()  # Convert to uppercase
-                else:
-                    major_title = major_section_dir.replace('-', ' ').upper()
-            else:
-                major_title = major_section_dir.replace('-', ' ').upper()
+            major_order, major_title = _major_section_title(parts[1])
             
             # Extract minor section if exists (e.g., "1-1-운영체제" -> "운영체제")
             minor_title = None
             minor_order = ""
             if len(parts) >= 4:
-                minor_section_dir = parts[2]
-                if '-' in minor_section_dir:
-                    minor_parts = minor_section_dir.split('-', 2)  # Split at most 2 times
-                    if len(minor_parts) >= 3:
-                        minor_order = minor_parts[1]  # Store ordering number
-                        minor_title = minor_parts[2].replace('-', ' ').title()
-                    else:
-                        minor_title = minor_section_dir.replace('-', ' ').title()
-                else:
-                    minor_title = minor_section_dir.replace('-', ' ').title()
+                minor_order, minor_title = _minor_section_title(parts[2])
             
             # Create section key with ordering for proper sorting
             section_key = f"{major_order}_{major_title}" if major_order else major_title
             
             # Initialize major section if not exists
-            if section_key not in sections:
-                sections[section_key] = {
+            section_info = sections.get(section_key)
+            if section_info is None:
+                section_info = sections[section_key] = {
                     'title': major_title,
                     'order': major_order,
                     'subsections': {}
@@ -129,18 +261,17 @@ def generate_book_structure(root_path, markdown_files, title=None, author=None):
             # Add to appropriate subsection or main section
             if minor_title:
                 subsection_key = f"{minor_order}_{minor_title}" if minor_order else minor_title
-                if subsection_key not in sections[section_key]['subsections']:
-                    sections[section_key]['subsections'][subsection_key] = {
+                subsection_info = section_info['subsections'].get(subsection_key)
+                if subsection_info is None:
+                    subsection_info = section_info['subsections'][subsection_key] = {
                         'title': minor_title,
                         'order': minor_order,
                         'files': []
                     }
-                sections[section_key]['subsections'][subsection_key]['files'].append(file_path)
+                subsection_info['files'].append(file_path)
             else:
                 # File directly under major section
-                if '_direct_files' not in sections[section_key]:
-                    sections[section_key]['_direct_files'] = []
-                sections[section_key]['_direct_files'].append(file_path)
+                section_info.setdefault('_direct_files', []).append(file_path)
     
     # Convert to the expected hierarchical format
     book_structure = {
@@ -160,14 +291,14 @@ def generate_book_structure(root_path, markdown_files, title=None, author=None):
         
         # Add direct files if any
         if '_direct_files' in section_info:
-            section_data['files'] = sorted(section_info['_direct_files'], key=natural_sort_key)
+            section_data['files'] = section_info['_direct_files']
         
         # Sort and add subsections
         sorted_subsections = sorted(section_info['subsections'].items(), key=lambda x: natural_sort_key(x[0]))
         for subsection_key, subsection_info in sorted_subsections:
             section_data['subsections'].append({
                 'title': subsection_info['title'],
-                'files': sorted(subsection_info['files'], key=natural_sort_key)
+                'files': subsection_info['files']
             })
         
         book_structure['sections'].append(section_data)
@@ -193,37 +324,10 @@ def generate_export_config(root_path, output_file=None, font_size=None, exclude_
     if exclude_folders is None:
         exclude_folders = []
     
-    # Font size presets
-    font_presets = {
-        'small': {
-            'base_font_size': '10pt',
-            'line_height': '1.5',
-            'h1_size': '20pt',
-            'h2_size': '16pt',
-            'h3_size': '14pt',
-            'code_size': '9pt'
-        },
-        'medium': {
-            'base_font_size': '12pt',
-            'line_height': '1.6',
-            'h1_size': '24pt',
-            'h2_size': '20pt',
-            'h3_size': '16pt',
-            'code_size': '10pt'
-        },
-        'large': {
-            'base_font_size': '14pt',
-            'line_height': '1.7',
-            'h1_size': '28pt',
-            'h2_size': '24pt',
-            'h3_size': '18pt',
-            'code_size': '12pt'
-        }
-    }
-    
     # Determine font settings
-    if font_size and font_size in font_presets:
-        font_settings = font_presets[font_size]
+    # Presets are copied so the returned config can be modified freely
+    if font_size and font_size in _FONT_PRESETS:
+        font_settings = dict(_FONT_PRESETS[font_size])
     elif font_size and font_size.endswith('pt'):
         # Custom font size
         base_size = int(font_size[:-2])
@@ -237,7 +341,7 @@ def generate_export_config(root_path, output_file=None, font_size=None, exclude_
         }
     else:
         # Default medium
-        font_settings = font_presets['medium']
+        font_settings = dict(_FONT_PRESETS['medium'])
     
     return {
         'page_size': 'A4',
@@ -248,6 +352,7 @@ def generate_export_config(root_path, output_file=None, font_size=None, exclude_
             'right': 15
         },
         'output_file': output_file,
+        'cache_dir': '.cache/md2html',
         'template': 'src/templates/pdf_template.html',
         'css': 'src/templates/styles.css',
         'source_root': root_path,
@@ -255,6 +360,31 @@ def generate_export_config(root_path, output_file=None, font_size=None, exclude_
         'font_settings': font_settings
     }
 
+def _write_if_changed(path, content):
+    """
+    Write a text file unless it already holds exactly the given content.
+    
+    Leaving an unchanged file alone keeps its modification time, so caches
+    keyed on it (such as load_config's) stay valid across rebuilds.
+    
+    Args:
+        path: File path
+        content: Text to write
+        
+    Returns:
+        bool: True if the file was written, False if it was already up to date
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
 def build_config_files(source_path, output_file=None, title=None, author=None, font_size=None, exclude_folders=None):
     """
     Build configuration files based on source path.
@@ -267,12 +397,9 @@ def build_config_files(source_path, output_file=None, title=None, author=None, f
         font_size: Font size preset or custom size (optional)
         exclude_folders: List of folders to exclude (optional)
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)
-    
     # Try to load existing export config to get exclude_folders if not provided
     if exclude_folders is None:
-        export_config_path = os.path.join(project_root, 'config', 'export_config.yaml')
+        export_config_path = os.path.join(_PROJECT_ROOT, 'config', 'export_config.yaml')
         if os.path.exists(export_config_path):
             try:
                 existing_config = load_config(export_config_path)
@@ -300,22 +427,23 @@ def build_config_files(source_path, output_file=None, title=None, author=None, f
     export_config = generate_export_config(source_path, output_file, font_size, exclude_folders)
     
     # Ensure config directory exists
-    config_dir = os.path.join(project_root, 'config')
+    config_dir = os.path.join(_PROJECT_ROOT, 'config')
     os.makedirs(config_dir, exist_ok=True)
     
-    # Write book_structure.yaml
+    # Write book_structure.yaml; each file is serialized to a string first
+    # and written with a single call instead of one per emitted token
     book_structure_path = os.path.join(config_dir, 'book_structure.yaml')
-    with open(book_structure_path, 'w', encoding='utf-8') as f:
-        yaml.dump(book_structure, f, default_flow_style=False, allow_unicode=True, indent=2)
+    book_structure_yaml = yaml.dump(book_structure, default_flow_style=False, allow_unicode=True, indent=2, Dumper=_YamlDumper)
+    book_structure_written = _write_if_changed(book_structure_path, book_structure_yaml)
     
     # Write export_config.yaml
     export_config_path = os.path.join(config_dir, 'export_config.yaml')
-    with open(export_config_path, 'w', encoding='utf-8') as f:
-        yaml.dump(export_config, f, default_flow_style=False, allow_unicode=True, indent=2)
+    export_config_yaml = yaml.dump(export_config, default_flow_style=False, allow_unicode=True, indent=2, Dumper=_YamlDumper)
+    export_config_written = _write_if_changed(export_config_path, export_config_yaml)
     
     print("Generated configuration files:")
-    print(f"  - {book_structure_path}")
-    print(f"  - {export_config_path}")
+    print(f"  - {book_structure_path}" + ("" if book_structure_written else " (unchanged)"))
+    print(f"  - {export_config_path}" + ("" if export_config_written else " (unchanged)"))
     
     return True
 
@@ -326,12 +454,9 @@ def export_pdf(output_file=None):
     Args:
         output_file: Optional output file path to override config
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)
-    
     # Configuration file paths
-    export_config_path = os.path.join(project_root, 'config', 'export_config.yaml')
-    book_structure_path = os.path.join(project_root, 'config', 'book_structure.yaml')
+    export_config_path = os.path.join(_PROJECT_ROOT, 'config', 'export_config.yaml')
+    book_structure_path = os.path.join(_PROJECT_ROOT, 'config', 'book_structure.yaml')
     
     # Check if config files exist
     if not os.path.exists(export_config_path):
@@ -345,23 +470,26 @@ def export_pdf(output_file=None):
         return False
      # Load configuration files
     export_config = load_config(export_config_path)
-    book_structure = load_config(book_structure_path)
-
-    # Ensure title and author from book_structure are in export_config
-    if 'title' in book_structure and 'title' not in export_config:
-        export_config['title'] = book_structure['title']
-    if 'author' in book_structure and 'author' not in export_config:
-        export_config['author'] = book_structure['author']
 
     # Override output file if specified
     if output_file:
         export_config['output_file'] = output_file
     
     # Resolve paths
-    export_config = resolve_paths(export_config, project_root)
+    export_config = resolve_paths(export_config, _PROJECT_ROOT)
+    
+    # The book structure is the large file; keep a JSON copy of it in the
+    # cache directory so later exports skip the YAML parse
+    book_structure = load_config(book_structure_path, export_config.get('cache_dir'))
+
+    # Ensure title and author from book_structure are in export_config
+    if 'title' in book_structure and 'title' not in export_config:
+        export_config['title'] = book_structure['title']
+    if 'author' in book_structure and 'author' not in export_config:
+        export_config['author'] = book_structure['author']
     
-    # Get source_root (from export_config or use project_root)
-    source_root = export_config.get('source_root', project_root)
+    # Get source_root (from export_config or use the project root)
+    source_root = export_config.get('source_root', _PROJECT_ROOT)
     book_structure = resolve_book_structure_paths(book_structure, source_root)
     
     # Collect markdown files with hierarchical section information
@@ -372,71 +500,75 @@ def export_pdf(output_file=None):
     if 'sections' in book_structure:
         for section in book_structure['sections']:
             section_title = section.get('title', 'Untitled Section')
+            subsections = section.get('subsections')
             
             # Handle hierarchical structure with subsections
-            if 'subsections' in section and section['subsections']:
+            if subsections:
+                direct_files = section.get('files')
+                
                 # Prepare table of contents for major section (중분류까지만)
+                # together with the subsection entries it lists
                 toc_items = []
+                subsection_entries = []
                 subsection_counter = 1
                 
                 # Add direct files of major section if any
-                if 'files' in section and section['files']:
+                if direct_files:
                     toc_items.append({
                         'number': f"{subsection_counter}",
                         'title': f"{section_title} - General"
                     })
+                    subsection_entries.append({
+                        'title': f"{section_title} - General",
+                        'type': 'subsection',
+                        'files': direct_files
+                    })
                     subsection_counter += 1
                 
                 # Add each subsection to TOC (중분류 제목만, 파일 목록 제외)
-                for subsection in section['subsections']:
+                for subsection in subsections:
                     if 'files' in subsection:
+                        subsection_title = subsection.get('title', 'Untitled Subsection')
                         toc_items.append({
                             'number': f"{subsection_counter}",
-                            'title': subsection.get('title', 'Untitled Subsection')
+                            'title': subsection_title
+                        })
+                        subsection_entries.append({
+                            'title': subsection_title,
+                            'type': 'subsection',
+                            'files': subsection['files']
                         })
                         subsection_counter += 1
                 
-                # Add major section header with table of contents
+                # Add major section header with table of contents, followed
+                # by the general entry and the subsections
                 sections_with_files.append({
                     'title': section_title,
                     'type': 'major_section',
                     'files': [],
                     'toc': toc_items
                 })
-                
-                # Add direct files of major section if any
-                if 'files' in section and section['files']:
-                    sections_with_files.append({
-                        'title': f"{section_title} - General",
-                        'type': 'subsection',
-                        'files': section['files']
-                    })
-                    total_files += len(section['files'])
-                
-                # Add each subsection
-                for subsection in section['subsections']:
-                    if 'files' in subsection:
-                        sections_with_files.append({
-                            'title': subsection.get('title', 'Untitled Subsection'),
-                            'type': 'subsection',
-                            'files': subsection['files']
-                        })
-                        total_files += len(subsection['files'])
+                sections_with_files.extend(subsection_entries)
+                total_files += sum(len(entry['files']) for entry in subsection_entries)
             else:
                 # Handle old flat structure or sections with only direct files
                 if 'files' in section:
+                    direct_files = section['files']
                     sections_with_files.append({
                         'title': section_title,
                         'type': 'section',
-                        'files': section['files']
+                        'files': direct_files
                     })
-                    total_files += len(section['files'])
+                    total_files += len(direct_files)
     
-    print(f"Project root: {project_root}")
+    print(f"Project root: {_PROJECT_ROOT}")
     print(f"Source root: {source_root}")
     print(f"Number of sections: {len(sections_with_files)}")
     print(f"Total markdown files to process: {total_files}")
     
+    # Imported here so --build and --help do not pay for loading WeasyPrint
+    from exporters.pdf_exporter import PdfExporter
+    
     # Initialize PDF exporter and execute
     pdf_exporter = PdfExporter(export_config)
     final_output_file = export_config['output_file']
@@ -445,9 +577,7 @@ def export_pdf(output_file=None):
     os.makedirs(os.path.dirname(final_output_file), exist_ok=True)
     
     # Export to PDF with section structure
-    pdf_exporter.export_to_pdf_with_sections(sections_with_files, final_output_file)
-    
-    return True
+    return pdf_exporter.export_to_pdf_with_sections(sections_with_files, final_output_file)
 
 def interactive_mode():
     """
@@ -481,13 +611,12 @@ def interactive_mode():
         # Expand user path if needed
         source_path = os.path.expanduser(source_path)
         
-        if not os.path.exists(source_path):
-            print(f"❌ Path does not exist: {source_path}")
-            continue
-            
-        docs_path = os.path.join(source_path, 'docs')
-        if not os.path.exists(docs_path):
-            print(f"❌ 'docs' directory not found in: {source_path}")
+        # The source itself is only checked to pick the error message
+        if not validate_path(source_path):
+            if not os.path.exists(source_path):
+                print(f"❌ Path does not exist: {source_path}")
+            else:
+                print(f"❌ 'docs' directory not found in: {source_path}")
             continue
             
         break
@@ -589,11 +718,8 @@ def validate_path(path):
     Returns:
         bool: True if valid, False otherwise
     """
-    if not os.path.exists(path):
-        return False
-    
-    docs_path = os.path.join(path, 'docs')
-    return os.path.exists(docs_path)
+    # A docs directory implies the path exists, so one stat covers both
+    return os.path.isdir(os.path.join(path, 'docs'))
 
 def main():
     parser = argparse.ArgumentParser(
@@ -663,12 +789,11 @@ Examples:
     
     # Build configuration files if requested
     if args.build:
-        if not os.path.exists(args.path):
-            print(f"Error: Path does not exist: {args.path}")
-            return 1
-        
         if not validate_path(args.path):
-            print(f"Error: Invalid path. Directory must contain a 'docs' subdirectory: {args.path}")
+            if not os.path.exists(args.path):
+                print(f"Error: Path does not exist: {args.path}")
+            else:
+                print(f"Error: Invalid path. Directory must contain a 'docs' subdirectory: {args.path}")
             return 1
         
         output_file = args.export if args.export else None
@@ -1,11 +1,93 @@
+import copy
+import hashlib
+import json
 import os
+from functools import lru_cache
 import yaml
 
-def load_config(config_file):
+# Use the libyaml-backed loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+@lru_cache(maxsize=8)
+def _parse_config(config_file, mtime_ns, size, cache_dir=None):
+    """
+    Parse a YAML file; the stat values key the caches.
+    
+    When cache_dir is set, the parsed data is also stored there as JSON,
+    which later processes read instead of parsing the YAML again as long
+    as the file's path, modification time and size still match.
+    """
+    source_key = [config_file, mtime_ns, size]
+    if cache_dir:
+        digest = hashlib.blake2b(config_file.encode('utf-8'), digest_size=16, person=b'config-json')
+        cache_path = os.path.join(cache_dir, f"{digest.hexdigest()}.json")
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as file:
+                cached = json.load(file)
+            if cached.get('source') == source_key:
+                return cached['config']
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+    
     with open(config_file, 'r', encoding='utf-8') as file:
-        config = yaml.safe_load(file)
+        config = yaml.load(file, Loader=_YamlLoader)
+    
+    if cache_dir:
+        serialized = json.dumps({'source': source_key, 'config': config}, ensure_ascii=False)
+        # Only cache data JSON reproduces exactly (no dates, non-string keys, ...)
+        if json.loads(serialized)['config'] == config:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                # Write to a temporary file first so readers never see a partial entry
+                temp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    file.write(serialized)
+                os.replace(temp_path, cache_path)
+            except OSError:
+                pass
     return config
 
+def load_config(config_file, cache_dir=None):
+    """
+    Load a YAML configuration file.
+    
+    Parsed files are cached by path, modification time and size, so loading
+    the same unchanged file again in one process skips the YAML parse.
+    
+    Args:
+        config_file: Path to the YAML file
+        cache_dir: Directory for a JSON copy of the parsed file that later
+            runs load instead of the YAML (optional)
+        
+    Returns:
+        Loaded configuration; a fresh copy the caller may modify
+    """
+    stat = os.stat(config_file)
+    config = _parse_config(os.path.abspath(config_file), stat.st_mtime_ns, stat.st_size, cache_dir)
+    return copy.deepcopy(config)
+
+def _resolve_files(file_paths, source_root):
+    """
+    Make relative file paths absolute against source_root.
+    
+    The joined prefix is computed once, so each relative path costs a
+    single string concatenation instead of an os.path.join call.
+    
+    Args:
+        file_paths: List of file paths
+        source_root: Directory relative paths are resolved against
+        
+    Returns:
+        New list with relative paths prefixed and absolute paths unchanged
+    """
+    # os.path.join(source_root, '') adds the separator only when needed,
+    # so prefix + path matches os.path.join(source_root, path)
+    prefix = os.path.join(source_root, '')
+    return [file_path if os.path.isabs(file_path) else prefix + file_path for file_path in file_paths]
+
 def resolve_paths(config, project_root):
     """
     Converts relative paths in the configuration file to absolute paths.
@@ -36,15 +118,14 @@ def resolve_paths(config, project_root):
         if not os.path.isabs(resolved_config['output_file']):
             resolved_config['output_file'] = os.path.join(project_root, resolved_config['output_file'])
     
+    # Resolve HTML cache directory relative to project_root
+    if resolved_config.get('cache_dir'):
+        if not os.path.isabs(resolved_config['cache_dir']):
+            resolved_config['cache_dir'] = os.path.join(project_root, resolved_config['cache_dir'])
+    
     # Resolve markdown files relative to source_root
     if 'include_markdown_files' in resolved_config:
-        resolved_files = []
-        for file_path in resolved_config['include_markdown_files']:
-            if not os.path.isabs(file_path):
-                resolved_files.append(os.path.join(source_root, file_path))
-            else:
-                resolved_files.append(file_path)
-        resolved_config['include_markdown_files'] = resolved_files
+        resolved_config['include_markdown_files'] = _resolve_files(resolved_config['include_markdown_files'], source_root)
     
     return resolved_config
 
@@ -65,24 +146,12 @@ def resolve_book_structure_paths(book_structure, source_root):
         for section in resolved_structure['sections']:
             # Handle direct files in the section
             if 'files' in section:
-                resolved_files = []
-                for file_path in section['files']:
-                    if not os.path.isabs(file_path):
-                        resolved_files.append(os.path.join(source_root, file_path))
-                    else:
-                        resolved_files.append(file_path)
-                section['files'] = resolved_files
+                section['files'] = _resolve_files(section['files'], source_root)
             
             # Handle subsections (hierarchical structure)
             if 'subsections' in section:
                 for subsection in section['subsections']:
                     if 'files' in subsection:
-                        resolved_files = []
-                        for file_path in subsection['files']:
-                            if not os.path.isabs(file_path):
-                                resolved_files.append(os.path.join(source_root, file_path))
-                            else:
-                                resolved_files.append(file_path)
-                        subsection['files'] = resolved_files
+                        subsection['files'] = _resolve_files(subsection['files'], source_root)
     
     return resolved_structure
\ No newline at end of file
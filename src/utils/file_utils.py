@@ -1,7 +1,25 @@
+import mmap
+import os
+
+# Files at least this large (in bytes) are decoded from a memory map
+MMAP_THRESHOLD = 256 * 1024
+
 def read_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < MMAP_THRESHOLD:
+            # Setting up a mapping costs more than a plain read for small files
+            # (and mmap cannot map an empty file)
+            content = file.read().decode('utf-8')
+        else:
+            # Decode straight from the mapped pages instead of reading into an
+            # intermediate bytes object first
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content = str(mapped, 'utf-8')
+    # Match text-mode reads, which translate \r\n and \r line endings to \n
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
 
 def write_file(file_path, content):
     with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
\ No newline at end of file
+        file.write(content)
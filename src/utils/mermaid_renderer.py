@@ -1,21 +1,191 @@
 import asyncio
+import atexit
+import hashlib
 import json
+import os
+import threading
 from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+from lxml import etree
+from utils.file_utils import read_file, write_file
+
+# Mermaid build loaded by the rendering page; it is downloaded once and then
+# served to the page from a local copy
+MERMAID_JS_URL = 'https://cdn.jsdelivr.net/npm/mermaid@10.9.1/dist/mermaid.min.js'
+
+# Chromium switches for rendering diagrams. Playwright already disables
+# extensions, background networking, default apps and first-run setup, hides
+# scrollbars and mutes audio; its --blink-settings and --disable-features
+# values are left alone, as passing them again would replace them
+_CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    # Diagrams are plain SVG, so skip GPU process setup
+    '--disable-gpu',
+    '--disable-sync',
+]
+
+# Seconds to wait for a single diagram to render
+MERMAID_RENDER_TIMEOUT = 10
+
+# Bump when the page setup or the SVG post-processing changes, so SVGs cached
+# on disk by earlier versions are not reused
+MERMAID_CACHE_VERSION = '3'
+
+# Maximum number of pages rendering diagrams of a batch at the same time
+MERMAID_MAX_PAGES = 4
+
+# Maximum number of rendered SVGs kept in memory per renderer
+MERMAID_MEMORY_CACHE_SIZE = 256
+
+# Renders one diagram inside the page's #mermaid-diagram container, so the
+# page styles apply while Mermaid measures the labels, and returns its SVG
+_RENDER_DIAGRAM_JS = '''
+    async ([diagramId, code]) => {
+        const container = document.getElementById('mermaid-diagram');
+        const { svg } = await mermaid.render(diagramId, code, container);
+        return svg;
+    }
+'''
+
+# Styles applied to every rendered diagram so it stays legible in the PDF:
+# dark text and strokes, plus a stroke and a light fill for shapes whose
+# inline style does not set their own
+_SVG_PDF_FONT_FAMILY = '-apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif'
+_SVG_PDF_CSS = (
+    'text, tspan {'
+    ' fill: #111827 !important;'
+    ' font-weight: 500 !important;'
+    f' font-family: {_SVG_PDF_FONT_FAMILY} !important; }}'
+    ' path { stroke: #374151 !important; }'
+    ' path:not([style*="stroke:"]) { stroke-width: 2px !important; }'
+    ' rect:not([style*="stroke:"]), circle:not([style*="stroke:"]),'
+    ' ellipse:not([style*="stroke:"]), polygon:not([style*="stroke:"]),'
+    ' polyline:not([style*="stroke:"]) { stroke: #374151 !important; stroke-width: 2px !important; }'
+    ' rect:not([style*="fill:"]), circle:not([style*="fill:"]),'
+    ' ellipse:not([style*="fill:"]), polygon:not([style*="fill:"]),'
+    ' polyline:not([style*="fill:"]) { fill: #f9fafb !important; }'
+)
+
+# Mermaid SVGs embed HTML labels, so they are parsed with the forgiving HTML
+# parser; it lowercases tag names (foreignObject becomes foreignobject)
+_SVG_PARSER = etree.HTMLParser()
+
+def _text_content(element):
+    """Return the element's text with each text node stripped and joined"""
+    return ''.join(text.strip() for text in element.itertext())
+
+def _replace_element(old, new):
+    """Put new in place of old, keeping the text that followed old"""
+    new.tail = old.tail
+    old.getparent().replace(old, new)
+
+def _remove_element(element):
+    """Remove an element from its parent, keeping the text that followed it"""
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + element.tail
+        else:
+            parent.text = (parent.text or '') + element.tail
+    parent.remove(element)
+
+def _find_foreign_objects(svg):
+    """
+    Find the foreignObject elements of an SVG along with their ancestry
+    
+    Siblings share their ancestors, so each ancestor is examined once: a
+    foreignObject only climbs until it reaches an element that an earlier
+    one already resolved.
+    
+    Args:
+        svg: The svg element
+        
+    Returns:
+        List of (foreignObject, nearest ancestor whose class contains 'node'
+        and 'default' or None, class names of its ancestors below the svg
+        element, nearest first) tuples in document order
+    """
+    found = []
+    # Resolved elements: (nearest node group among the element and its
+    # ancestors, their class names, nearest first)
+    ancestry = {}
+    for foreign_obj in svg.iter('foreignobject'):
+        path = []
+        parent = foreign_obj.getparent()
+        while parent is not None and parent.tag != 'svg' and parent not in ancestry:
+            path.append(parent)
+            parent = parent.getparent()
+        node_parent, class_names = ancestry.get(parent, (None, ''))
+        
+        # Resolve the newly reached ancestors from the outermost one down
+        for element in reversed(path):
+            element_class = element.get('class', '')
+            if 'node' in element_class and 'default' in element_class:
+                node_parent = element
+            if element_class.strip():
+                class_names = ' '.join(element_class.split() + ([class_names] if class_names else []))
+            ancestry[element] = (node_parent, class_names)
+        found.append((foreign_obj, node_parent, class_names))
+    return found
+
+# Elements whose whitespace-only text is significant or raw content
+_SVG_TEXT_TAGS = frozenset(('text', 'tspan', 'style', 'title', 'desc'))
+
+def _strip_svg_tree(svg):
+    """Remove comments, empty groups and whitespace between elements"""
+    # One walk of the tree strips the whitespace and collects what to remove
+    comments = []
+    groups = []
+    for element in svg.iter():
+        tag = element.tag
+        if tag is etree.Comment:
+            comments.append(element)
+            continue
+        if tag == 'g':
+            groups.append(element)
+        elif tag in _SVG_TEXT_TAGS:
+            continue
+        if element.text and not element.text.strip():
+            element.text = None
+        for child in element:
+            if child.tail and not child.tail.strip():
+                child.tail = None
+    for comment in comments:
+        _remove_element(comment)
+    # Children come after their parent in document order, so walking it
+    # backwards also removes groups that only contained empty groups
+    for group in reversed(groups):
+        if len(group) == 0 and not group.text:
+            _remove_element(group)
 
 class MermaidRenderer:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.playwright = None
         self.browser = None
+        # Directory for rendered SVGs keyed by diagram source (optional)
+        self.cache_dir = cache_dir
+        # Rendered SVGs keyed by the same digest, for repeats within a run
+        self.svg_cache = {}
+        # Source of the Mermaid script, once downloaded or read from cache_dir
+        self.mermaid_js = None
+        # Event loop running on a background thread for the synchronous
+        # wrappers, started on first use (see _run_sync)
+        self.loop = None
+        self.loop_lock = threading.Lock()
+        # Keeps concurrent batches from launching the browser twice
+        self.browser_lock = asyncio.Lock()
         
     async def init_browser(self):
         """Initialize the browser for rendering"""
-        if self.playwright is None:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-            )
+        async with self.browser_lock:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(
+                    headless=True,
+                    args=_CHROMIUM_ARGS
+                )
     
     async def close_browser(self):
         """Close the browser"""
@@ -37,42 +207,30 @@ class MermaidRenderer:
         Returns:
             SVG string of the rendered diagram
         """
-        await self.init_browser()
-        
-        # Create HTML content with Mermaid
-        html_content = self._create_mermaid_html(mermaid_code, theme)
-        
-        page = await self.browser.new_page()
+        results = await self.render_mermaid_batch([mermaid_code], theme)
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0]
+    
+    async def _render_in_page(self, page, diagram_id, mermaid_code):
+        """Render one diagram in a page that has Mermaid loaded"""
+        svg_content = await asyncio.wait_for(
+            page.evaluate(_RENDER_DIAGRAM_JS, [diagram_id, mermaid_code]),
+            MERMAID_RENDER_TIMEOUT
+        )
         
-        try:
-            # Set page content
-            await page.set_content(html_content)
-            
-            # Wait for Mermaid to render
-            await page.wait_for_selector('#mermaid-diagram', timeout=10000)
-            await page.wait_for_timeout(1000)  # Additional wait for rendering to complete
-            
-            # Get the SVG content
-            svg_content = await page.evaluate('''
-                () => {
-                    const svg = document.querySelector('#mermaid-diagram svg');
-                    return svg ? svg.outerHTML : null;
-                }
-            ''')
-            
-            if svg_content:
-                # Process SVG for better PDF rendering
-                return self._process_svg_for_pdf(svg_content)
-            else:
-                raise Exception("Failed to render Mermaid diagram")
-                
-        finally:
-            await page.close()
+        if svg_content:
+            # Process SVG for better PDF rendering
+            return self._process_svg_for_pdf(svg_content)
+        else:
+            raise Exception("Failed to render Mermaid diagram")
     
-    def _create_mermaid_html(self, mermaid_code, theme='default'):
-        """Create HTML content with Mermaid diagram"""
-        # Configure Mermaid theme for better visibility on white background
+    def _create_mermaid_html(self, theme='default'):
+        """Create the page that Mermaid diagrams are rendered in"""
+        # Configure Mermaid theme for better visibility on white background;
+        # diagrams are rendered explicitly, not on page load
         mermaid_config = {
+            'startOnLoad': False,
             'theme': 'base',
             'themeVariables': {
                 'primaryColor': '#2563eb',  # Blue
@@ -108,7 +266,7 @@ class MermaidRenderer:
         <html>
         <head>
             <meta charset="utf-8">
-            <script src="https://cdn.jsdelivr.net/npm/mermaid@10.9.1/dist/mermaid.min.js"></script>
+            <script src="{MERMAID_JS_URL}"></script>
             <style>
                 body {{
                     margin: 0;
@@ -195,13 +353,10 @@ class MermaidRenderer:
             </style>
         </head>
         <body>
-            <div id="mermaid-diagram" class="mermaid">
-                {mermaid_code}
-            </div>
+            <div id="mermaid-diagram" class="mermaid"></div>
             <script>
                 const config = {config_json};
                 mermaid.initialize(config);
-                mermaid.init();
             </script>
         </body>
         </html>
@@ -209,142 +364,84 @@ class MermaidRenderer:
     
     def _process_svg_for_pdf(self, svg_content):
         """Process SVG to ensure good visibility in PDF"""
-        soup = BeautifulSoup(svg_content, 'lxml')
-        
-        # Remove html and body wrappers if they exist
-        svg = soup.find('svg')
-        if not svg and soup.find('html'):
-            # Extract SVG from HTML wrapper
-            html_tag = soup.find('html')
-            svg = html_tag.find('svg') if html_tag else None
+        # The HTML parser wraps the markup in html and body elements
+        root = etree.fromstring(svg_content, _SVG_PARSER)
+        svg = root.find('.//svg')
         
-        if svg:
+        if svg is not None:
             # Ensure background is white
-            svg['style'] = 'background: white;'
+            svg.set('style', 'background: white;')
             
             # Convert foreignObject elements to native SVG text elements
             # Mermaid uses foreignObject for text, which WeasyPrint doesn't handle well
+            # (the HTML parser lowercases tag names)
             converted_count = 0
-            foreign_objects = soup.find_all('foreignobject')
             
             # Group foreignObjects by their parent class (for class diagrams)
             class_groups = {}
             
             # Check if this is a class diagram by looking at SVG role
-            svg_element = soup.find('svg')
-            is_class_diagram = False
-            if svg_element and svg_element.get('aria-roledescription') == 'classDiagram':
-                is_class_diagram = True
+            is_class_diagram = svg.get('aria-roledescription') == 'classDiagram'
             
-            for foreign_obj in foreign_objects:
-                # Find the node parent (g.node.default for class diagrams)
-                parent = foreign_obj.parent
-                node_parent = None
-                while parent and parent.name != 'svg':
-                    parent_class = parent.get('class', '')
-                    if isinstance(parent_class, list):
-                        parent_class = ' '.join(parent_class)
-                    
-                    if 'node' in str(parent_class) and 'default' in str(parent_class):
-                        node_parent = parent
-                        break
-                    parent = parent.parent
-                
+            for foreign_obj, node_parent, parent_class in _find_foreign_objects(svg):
                 # For class diagrams, group by the node parent
-                if is_class_diagram and node_parent:
+                if is_class_diagram and node_parent is not None:
                     group_id = node_parent.get('data-id', 'class_unknown')
                     if group_id not in class_groups:
                         class_groups[group_id] = []
-                    class_groups[group_id].append(foreign_obj)
+                    class_groups[group_id].append((foreign_obj, parent_class))
                 else:
                     # For other diagrams, treat individually
                     individual_key = f"individual_{len(class_groups)}"
-                    class_groups[individual_key] = [foreign_obj]
+                    class_groups[individual_key] = [(foreign_obj, parent_class)]
             
             for group_id, group_objects in class_groups.items():
                 # For class diagrams with multiple texts in same node, arrange vertically
                 if is_class_diagram and len(group_objects) > 1:
-                    for i, foreign_obj in enumerate(group_objects):
-                        text_element = self._convert_foreign_object_to_text_for_class(foreign_obj, soup, i, len(group_objects))
-                        if text_element:
-                            foreign_obj.replace_with(text_element)
+                    for i, (foreign_obj, _) in enumerate(group_objects):
+                        text_element = self._convert_foreign_object_to_text_for_class(foreign_obj, i, len(group_objects))
+                        if text_element is not None:
+                            _replace_element(foreign_obj, text_element)
                             converted_count += 1
                         else:
-                            foreign_obj.decompose()
+                            _remove_element(foreign_obj)
                 else:
                     # Single elements (flowcharts, etc.)
-                    for foreign_obj in group_objects:
-                        text_element = self._convert_foreign_object_to_text_simple(foreign_obj, soup)
-                        if text_element:
-                            foreign_obj.replace_with(text_element)
+                    for foreign_obj, parent_class in group_objects:
+                        text_element = self._convert_foreign_object_to_text_simple(foreign_obj, parent_class)
+                        if text_element is not None:
+                            _replace_element(foreign_obj, text_element)
                             converted_count += 1
                         else:
-                            foreign_obj.decompose()
-            
-            # Second pass: Process all remaining text elements
-            for text in soup.find_all(['text', 'tspan']):
-                self._apply_dark_text_style(text)
-            
-            # Third pass: Process path elements (lines, arrows, shapes)
-            for path in soup.find_all('path'):
-                self._apply_dark_stroke_style(path)
+                            _remove_element(foreign_obj)
             
-            # Fourth pass: Process shape elements (rectangles, circles, etc.)
-            for shape in soup.find_all(['rect', 'circle', 'ellipse', 'polygon', 'polyline']):
-                self._apply_shape_style(shape)
+            # Restyle the whole diagram with one stylesheet; its !important
+            # declarations override both Mermaid's own <style> and inline styles
+            style = etree.Element('style')
+            style.text = _SVG_PDF_CSS
+            svg.insert(0, style)
             
-            # Fifth pass: Process g (group) elements that might contain text
-            for group in soup.find_all('g'):
-                self._process_group_elements(group)
-            
-            # Final pass: Ensure all text is visible with additional fallback styling
-            self._apply_final_text_visibility_fixes(soup)
+            # Drop what the PDF does not need, so WeasyPrint parses a smaller tree
+            _strip_svg_tree(svg)
         
         # Return only the SVG part, not the HTML wrapper
-        if svg:
-            return str(svg)
+        if svg is not None:
+            return etree.tostring(svg, method='html', encoding='unicode', with_tail=False)
         else:
-            return str(soup)
+            return etree.tostring(root, method='html', encoding='unicode')
     
-    def _apply_final_text_visibility_fixes(self, soup):
-        """Apply final fixes to ensure all text is visible"""
-        # Find all text elements and ensure they have proper styling
-        all_text_elements = soup.find_all(['text', 'tspan'])
-        for text_elem in all_text_elements:
-            # Make sure fill is always set to dark color
-            text_elem['fill'] = '#111827'
-            
-            # Ensure style includes visible properties
-            current_style = text_elem.get('style', '')
-            if 'fill:' not in current_style:
-                current_style += '; fill: #111827 !important'
-            if 'font-weight:' not in current_style:
-                current_style += '; font-weight: 500'
-            if 'font-family:' not in current_style:
-                current_style += '; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif'
-            
-            text_elem['style'] = current_style
-        
-        # Also check for any remaining foreign objects that might have been missed
-        remaining_foreign = soup.find_all('foreignobject')
-        for foreign_obj in remaining_foreign:
-            # Force visibility on any remaining foreign objects
-            for element in foreign_obj.find_all(['div', 'span', 'p']):
-                element['style'] = element.get('style', '') + '; color: #111827 !important; font-weight: 500 !important;'
-    
-    def _convert_foreign_object_to_text_for_class(self, foreign_obj, soup, index, total_count):
+    def _convert_foreign_object_to_text_for_class(self, foreign_obj, index, total_count):
         """Convert foreignObject to text element for class diagrams with proper vertical positioning"""
         try:
             # Extract text content
             text_content = ""
-            text_divs = foreign_obj.find_all(['div', 'span'])
-            for div in text_divs:
-                content = div.get_text(strip=True)
+            for div in foreign_obj.iterdescendants('div', 'span'):
+                content = _text_content(div)
                 if content and len(content) > len(text_content):
                     text_content = content
             
             if not text_content:
-                text_content = foreign_obj.get_text(strip=True)
+                text_content = _text_content(foreign_obj)
             
             if not text_content:
                 return None
@@ -353,7 +450,7 @@ class MermaidRenderer:
             width = float(foreign_obj.get('width', '100'))
             
             # Create text element with vertical positioning for class diagrams
-            text_elem = soup.new_tag('text')
+            text_elem = etree.Element('text')
             
             # Position text elements vertically within the class box
             # Class boxes typically have sections: title, attributes, methods
@@ -369,44 +466,49 @@ class MermaidRenderer:
             if not text_content.strip():
                 return None
             
-            text_elem['x'] = str(width / 2)
-            text_elem['y'] = str(y_offset)
-            text_elem['text-anchor'] = 'middle'
-            text_elem['dominant-baseline'] = 'middle'
-            text_elem['fill'] = '#111827'
+            text_elem.set('x', str(width / 2))
+            text_elem.set('y', str(y_offset))
+            text_elem.set('text-anchor', 'middle')
+            text_elem.set('dominant-baseline', 'middle')
             
-            # Different styling for class name vs attributes/methods
+            # Different sizes for class name vs attributes/methods; colour,
+            # weight and font family come from _SVG_PDF_CSS
             # First non-empty element is usually the class name
             if index <= 1 and not any(c in text_content for c in ['+', '-', '#', '~']):
-                # Class name - bold and slightly larger
-                text_elem['style'] = 'font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif; font-size: 16px; font-weight: bold; fill: #111827;'
+                # Class name - slightly larger
+                text_elem.set('style', 'font-size: 16px')
             else:
                 # Attributes and methods - regular
-                text_elem['style'] = 'font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif; font-size: 14px; font-weight: 500; fill: #111827;'
+                text_elem.set('style', 'font-size: 14px')
             
-            text_elem.string = text_content
+            text_elem.text = text_content
             return text_elem
-            
+        
         except Exception as e:
             print(f"Warning: Failed to convert class foreignObject: {e}")
             return None
-
-    def _convert_foreign_object_to_text_simple(self, foreign_obj, soup):
-        """Simple conversion of foreignObject to SVG text element"""
+    
+    def _convert_foreign_object_to_text_simple(self, foreign_obj, parent_class):
+        """
+        Simple conversion of foreignObject to SVG text element
+        
+        Args:
+            foreign_obj: foreignObject element to convert
+            parent_class: Class names of its ancestors, to determine the diagram type
+        """
         try:
             # Extract text content - get the most relevant text
             text_content = ""
             
             # Look for text in nested elements
-            text_divs = foreign_obj.find_all(['div', 'span'])
-            for div in text_divs:
-                content = div.get_text(strip=True)
+            for div in foreign_obj.iterdescendants('div', 'span'):
+                content = _text_content(div)
                 if content and len(content) > len(text_content):
                     text_content = content
             
             # Fallback to all text
             if not text_content:
-                text_content = foreign_obj.get_text(strip=True)
+                text_content = _text_content(foreign_obj)
             
             if not text_content:
                 return None
@@ -424,254 +526,293 @@ class MermaidRenderer:
                 
                 # For class diagrams, use absolute positioning from foreignObject
                 # For other diagrams, use relative positioning
-                parent_class = self._get_parent_class_name(foreign_obj)
                 if 'classGroup' in parent_class:
                     # Class diagram: use absolute positioning with small adjustments
-                    text_elem = soup.new_tag('text')
-                    text_elem['x'] = str(x_pos + width / 2)  # Center horizontally
-                    text_elem['y'] = str(y_pos + height / 2 + 4)  # Center vertically with adjustment
+                    text_elem = etree.Element('text')
+                    text_elem.set('x', str(x_pos + width / 2))  # Center horizontally
+                    text_elem.set('y', str(y_pos + height / 2 + 4))  # Center vertically with adjustment
                 else:
                     # Other diagrams: use relative positioning
-                    text_elem = soup.new_tag('text')
-                    text_elem['x'] = str(width / 2)
-                    text_elem['y'] = str(height / 2 + 4)
-                    
+                    text_elem = etree.Element('text')
+                    text_elem.set('x', str(width / 2))
+                    text_elem.set('y', str(height / 2 + 4))
+            
             except (ValueError, TypeError):
                 # Fallback to relative positioning
-                text_elem = soup.new_tag('text')
-                text_elem['x'] = str(width / 2)
-                text_elem['y'] = str(height / 2 + 4)
+                text_elem = etree.Element('text')
+                text_elem.set('x', str(width / 2))
+                text_elem.set('y', str(height / 2 + 4))
             
-            text_elem['text-anchor'] = 'middle'
-            text_elem['dominant-baseline'] = 'middle'
-            text_elem['fill'] = '#111827'
-            text_elem['style'] = 'font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif; font-size: 14px; font-weight: 500; fill: #111827;'
-            text_elem.string = text_content
+            text_elem.set('text-anchor', 'middle')
+            text_elem.set('dominant-baseline', 'middle')
+            # Colour, weight and font family come from _SVG_PDF_CSS
+            text_elem.set('style', 'font-size: 14px')
+            text_elem.text = text_content
             
             return text_elem
-            
+        
         except Exception as e:
             print(f"Warning: Failed to convert foreignObject: {e}")
             return None
     
-    def _get_parent_class_name(self, element):
-        """Get class names from parent elements to determine diagram type"""
-        parent = element.parent
-        class_names = []
-        
-        while parent and parent.name != 'svg':
-            if parent.get('class'):
-                class_attr = parent.get('class')
-                if isinstance(class_attr, list):
-                    class_names.extend(class_attr)
-                else:
-                    class_names.append(class_attr)
-            parent = parent.parent
+    def render_mermaid_sync(self, mermaid_code, theme='default'):
+        """
+        Synchronous wrapper for rendering Mermaid diagrams
         
-        return ' '.join(class_names)
-
-    def _convert_foreign_object_to_text(self, foreign_obj, soup):
-        """Convert foreignObject with HTML content to native SVG text element"""
-        try:
-            # Extract all text content from the foreignObject
-            text_elements = []
-            all_text_nodes = foreign_obj.find_all(['div', 'span', 'p'])
-            
-            for element in all_text_nodes:
-                text_content = element.get_text(strip=True) if element else ""
-                if text_content:
-                    text_elements.append(text_content)
-            
-            # If no individual elements found, try to get all text
-            if not text_elements:
-                text_content = foreign_obj.get_text(strip=True)
-                if text_content:
-                    text_elements = [text_content]
-            
-            if not text_elements:
-                return None
-            
-            # Get position and size information from the foreignObject
-            x = float(foreign_obj.get('x', '0'))
-            y = float(foreign_obj.get('y', '0'))
-            width = float(foreign_obj.get('width', '100'))
-            height = float(foreign_obj.get('height', '18'))
-            
-            # Check if this foreignObject is within a transformed group
-            parent_transform = self._get_parent_transform(foreign_obj)
-            if parent_transform:
-                x += parent_transform.get('x', 0)
-                y += parent_transform.get('y', 0)
-            
-            # Create a group to hold multiple text elements if needed
-            if len(text_elements) == 1:
-                # Single text element
-                text_elem = soup.new_tag('text')
-                text_elem['x'] = str(x + width / 2)
-                text_elem['y'] = str(y + height / 2 + 5)  # Slight vertical adjustment for better centering
-                text_elem['text-anchor'] = 'middle'
-                text_elem['dominant-baseline'] = 'middle'
-                text_elem['fill'] = '#111827'
-                text_elem['style'] = 'font-weight: 500; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif; font-size: 14px;'
-                text_elem.string = text_elements[0]
-                return text_elem
-            else:
-                # Multiple text elements (e.g., class diagram with title, attributes, methods)
-                group = soup.new_tag('g')
-                group['class'] = 'converted-text-group'
-                
-                line_height = 16
-                start_y = y + 12  # Start with some padding from top
-                
-                for i, text_content in enumerate(text_elements):
-                    text_elem = soup.new_tag('text')
-                    text_elem['x'] = str(x + width / 2)
-                    text_elem['y'] = str(start_y + (i * line_height))
-                    text_elem['text-anchor'] = 'middle'
-                    text_elem['dominant-baseline'] = 'middle'
-                    text_elem['fill'] = '#111827'
-                    
-                    # Apply different styling based on position (first element might be title)
-                    if i == 0 and len(text_elements) > 1:
-                        # Title styling
-                        text_elem['style'] = 'font-weight: bold; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif; font-size: 14px;'
-                    else:
-                        # Regular styling
-                        text_elem['style'] = 'font-weight: 500; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif; font-size: 12px;'
-                    
-                    text_elem.string = text_content
-                    group.append(text_elem)
-                
-                return group
+        Args:
+            mermaid_code: The Mermaid diagram code
+            theme: Theme for the diagram
             
-        except Exception as e:
-            print(f"Warning: Failed to convert foreignObject to text: {e}")
-            return None
+        Returns:
+            SVG string of the rendered diagram
+        """
+        return self._run_sync(self.render_mermaid_to_svg(mermaid_code, theme))
     
-    def _get_parent_transform(self, element):
-        """Extract transform information from parent elements"""
-        parent = element.parent
-        transform_info = {'x': 0, 'y': 0}
-        
-        while parent and parent.name != 'svg':
-            if parent.name == 'g' and parent.get('transform'):
-                transform = parent.get('transform')
-                # Simple parsing for translate(x,y) transforms
-                if 'translate(' in transform:
-                    # Extract translate values
-                    import re
-                    match = re.search(r'translate\(([^,\)]+)(?:,([^,\)]+))?\)', transform)
-                    if match:
-                        x_val = float(match.group(1))
-                        y_val = float(match.group(2)) if match.group(2) else 0
-                        transform_info['x'] += x_val
-                        transform_info['y'] += y_val
-            parent = parent.parent
+    async def render_mermaid_batch(self, mermaid_codes, theme='default'):
+        """
+        Render several Mermaid diagrams concurrently in the shared browser
         
-        return transform_info
-    
-    def _apply_dark_text_style(self, text_element):
-        """Apply dark styling to text elements"""
-        current_style = text_element.get('style', '')
-        style_parts = []
-        if current_style:
-            style_parts = [part.strip() for part in current_style.split(';') 
-                         if part.strip() and not part.strip().startswith('fill:')]
+        Up to MERMAID_MAX_PAGES pages of one browser context load Mermaid
+        once each and then render the pending diagrams with mermaid.render(),
+        which resolves as soon as a diagram's SVG is ready.
         
-        style_parts.extend([
-            'fill: #111827 !important',
-            'font-weight: 500',
-            'font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "Roboto", sans-serif'
-        ])
+        Args:
+            mermaid_codes: List of Mermaid diagram sources
+            theme: Theme for the diagrams
+            
+        Returns:
+            List with the SVG string of each diagram, or the exception raised
+            while rendering it, in the same order as mermaid_codes
+        """
+        # Serve what the caches have; identical sources are rendered once
+        results = [None] * len(mermaid_codes)
+        pending = {}
+        for index, mermaid_code in enumerate(mermaid_codes):
+            cache_key = self._svg_cache_key(mermaid_code, theme)
+            svg_content = self._load_cached_svg(cache_key)
+            if svg_content is None:
+                pending.setdefault((mermaid_code, cache_key), []).append(index)
+            else:
+                results[index] = svg_content
+        if not pending:
+            # Everything was cached, so the browser is never started
+            return results
         
-        text_element['style'] = '; '.join(style_parts)
-        text_element['fill'] = '#111827'
+        await self.init_browser()
+        # Pages of one context share its HTTP cache, so the Mermaid script is
+        # downloaded once; each page takes the next pending diagram when it is free
+        context = await self.browser.new_context()
+        try:
+            mermaid_js_lock = asyncio.Lock()
+            await context.route(MERMAID_JS_URL, lambda route: self._serve_mermaid_js(route, mermaid_js_lock))
+            jobs = iter(pending.items())
+            page_count = min(MERMAID_MAX_PAGES, len(pending))
+            outcomes = await asyncio.gather(
+                *(self._render_jobs(context, theme, jobs, results) for _ in range(page_count)),
+                return_exceptions=True
+            )
+            # Diagrams are only left unrendered when no page could be set up
+            failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+            if len(failures) == page_count:
+                raise failures[0]
+            return results
+        finally:
+            await context.close()
     
-    def _apply_dark_stroke_style(self, path_element):
-        """Apply dark stroke styling to path elements"""
-        current_style = path_element.get('style', '')
-        style_parts = []
-        if current_style:
-            style_parts = [part.strip() for part in current_style.split(';') 
-                         if part.strip()]
-        
-        # Ensure dark stroke for visibility
-        has_stroke = any('stroke:' in part for part in style_parts)
-        if not has_stroke:
-            style_parts.append('stroke: #374151')
-            style_parts.append('stroke-width: 2px')
-        else:
-            # Update existing stroke to be darker
-            style_parts = [part if not part.strip().startswith('stroke:') 
-                         else 'stroke: #374151' for part in style_parts]
+    async def _render_jobs(self, context, theme, jobs, results):
+        """
+        Render pending diagrams in a new page until the shared jobs run out
         
-        path_element['style'] = '; '.join(style_parts)
+        Args:
+            context: Browser context to open the page in
+            theme: Theme for the diagrams
+            jobs: Iterator over ((diagram source, cache key), result indices),
+                shared by all pages of the batch
+            results: Result list of the batch, filled in place
+        """
+        page = await self._open_render_page(context, theme)
+        try:
+            for (mermaid_code, cache_key), indices in jobs:
+                # Mermaid scopes each diagram's embedded styles by its SVG id;
+                # deriving the id from the source keeps it unique within the book
+                diagram_id = f'mermaid-{cache_key[:16]}'
+                try:
+                    result = await self._render_in_page(page, diagram_id, mermaid_code)
+                    self._store_cached_svg(cache_key, result)
+                except Exception as e:
+                    result = e
+                for index in indices:
+                    results[index] = result
+                
+                if isinstance(result, asyncio.TimeoutError):
+                    # mermaid.render may still be running and change the page
+                    # later, so the next diagram gets a fresh page
+                    await page.close()
+                    page = None
+                    page = await self._open_render_page(context, theme)
+        finally:
+            if page is not None:
+                await page.close()
     
-    def _apply_shape_style(self, shape_element):
-        """Apply styling to shape elements"""
-        current_style = shape_element.get('style', '')
-        style_parts = []
-        if current_style:
-            style_parts = [part.strip() for part in current_style.split(';') 
-                         if part.strip()]
-        
-        # Ensure dark stroke and light fill for shapes
-        has_stroke = any('stroke:' in part for part in style_parts)
-        has_fill = any('fill:' in part for part in style_parts)
-        
-        if not has_stroke:
-            style_parts.append('stroke: #374151')
-            style_parts.append('stroke-width: 2px')
+    async def _open_render_page(self, context, theme):
+        """Open a page in context with Mermaid loaded, ready to render diagrams"""
+        page = await context.new_page()
+        try:
+            await page.set_content(self._create_mermaid_html(theme))
+        except BaseException:
+            await page.close()
+            raise
+        return page
+    
+    async def _serve_mermaid_js(self, route, lock):
+        """
+        Answer a page's request for the Mermaid script from the local copy
         
-        if not has_fill:
-            style_parts.append('fill: #f9fafb')
+        The script is downloaded the first time it is requested and kept in
+        memory and, with a cache directory, on disk for later runs.
         
-        shape_element['style'] = '; '.join(style_parts)
+        Args:
+            route: Intercepted request for MERMAID_JS_URL
+            lock: Lock shared by the pages of a batch, so only one downloads
+        """
+        async with lock:
+            if self.mermaid_js is None and self.cache_dir:
+                try:
+                    self.mermaid_js = read_file(os.path.join(self.cache_dir, self._mermaid_js_file_name()))
+                except (OSError, UnicodeDecodeError):
+                    pass
+            if self.mermaid_js is None:
+                response = await route.fetch()
+                if not response.ok:
+                    # Let the page see the failed response
+                    await route.fulfill(response=response)
+                    return
+                self.mermaid_js = await response.text()
+                self._write_cache_file(self._mermaid_js_file_name(), self.mermaid_js)
+        await route.fulfill(body=self.mermaid_js, content_type='application/javascript')
     
-    def _process_group_elements(self, group):
-        """Process group elements that might contain text"""
-        current_class = group.get('class', '')
-        if isinstance(current_class, list):
-            current_class = ' '.join(current_class)
-        
-        if 'label' in current_class.lower() or 'text' in current_class.lower():
-            # Find all text elements within this group
-            for text in group.find_all(['text', 'tspan']):
-                self._apply_dark_text_style(text)
-            
-            # Also check for foreignObject elements
-            for foreign_obj in group.find_all('foreignobject'):
-                for element in foreign_obj.find_all(['div', 'span']):
-                    element['style'] = element.get('style', '') + '; color: #111827 !important;'
+    def _mermaid_js_file_name(self):
+        """Name of the local copy of the Mermaid script in cache_dir"""
+        digest = hashlib.blake2b(MERMAID_JS_URL.encode('utf-8'), digest_size=8)
+        return f"mermaid-{digest.hexdigest()}.js"
     
-    def render_mermaid_sync(self, mermaid_code, theme='default'):
+    def _svg_cache_key(self, mermaid_code, theme):
+        """Digest identifying a diagram source rendered with a theme"""
+        digest = hashlib.blake2b(f'{theme}\0{mermaid_code}'.encode('utf-8'), digest_size=16,
+                                 person=f'mermaid-v{MERMAID_CACHE_VERSION}'.encode())
+        return digest.hexdigest()
+    
+    def _load_cached_svg(self, cache_key):
+        """Return a previously rendered SVG from memory or disk, or None"""
+        svg_content = self.svg_cache.get(cache_key)
+        if svg_content is None and self.cache_dir:
+            try:
+                svg_content = read_file(os.path.join(self.cache_dir, f"{cache_key}.svg"))
+            except (OSError, UnicodeDecodeError):
+                return None
+            self._remember_svg(cache_key, svg_content)
+        return svg_content
+    
+    def _store_cached_svg(self, cache_key, svg_content):
+        """Keep a rendered SVG in memory and, with a cache directory, on disk"""
+        self._remember_svg(cache_key, svg_content)
+        self._write_cache_file(f"{cache_key}.svg", svg_content)
+    
+    def _write_cache_file(self, file_name, content):
+        """Write a file to the cache directory, if there is one"""
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                cache_path = os.path.join(self.cache_dir, file_name)
+                # Write to a temporary file first so readers never see a partial entry
+                temp_path = f"{cache_path}.{os.getpid()}.tmp"
+                write_file(temp_path, content)
+                os.replace(temp_path, cache_path)
+            except OSError as e:
+                print(f"Warning: Failed to write Mermaid cache file {file_name}: {e}")
+    
+    def _remember_svg(self, cache_key, svg_content):
+        """Add an SVG to the in-memory cache, evicting the oldest entry when full"""
+        if len(self.svg_cache) >= MERMAID_MEMORY_CACHE_SIZE:
+            del self.svg_cache[next(iter(self.svg_cache))]
+        self.svg_cache[cache_key] = svg_content
+    
+    def render_mermaid_batch_sync(self, mermaid_codes, theme='default'):
         """
-        Synchronous wrapper for rendering Mermaid diagrams
+        Synchronous wrapper for rendering several Mermaid diagrams in one page
         
         Args:
-            mermaid_code: The Mermaid diagram code
-            theme: Theme for the diagram
+            mermaid_codes: List of Mermaid diagram sources
+            theme: Theme for the diagrams
             
         Returns:
-            SVG string of the rendered diagram
+            List with the SVG string or exception for each diagram
         """
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        return self._run_sync(self.render_mermaid_batch(mermaid_codes, theme))
+    
+    def _run_sync(self, coroutine):
+        """
+        Run a coroutine on the renderer's event loop and wait for its result
         
-        try:
-            return loop.run_until_complete(self.render_mermaid_to_svg(mermaid_code, theme))
-        finally:
-            # Don't close the loop here as it might be used elsewhere
-            pass
+        The loop runs forever on a daemon thread, so the browser it owns
+        stays usable across calls, and the synchronous wrappers also work
+        from threads that already run an event loop of their own.
+        """
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='mermaid-renderer', daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+# Renderer shared by everything rendered in this process, and the pid it was
+# created in (see get_renderer)
+_shared_renderer = None
+_shared_renderer_pid = None
+
+def get_renderer(cache_dir=None):
+    """
+    Return the process-wide MermaidRenderer, creating it on first use.
     
-    def __del__(self):
-        """Cleanup when object is destroyed"""
-        if self.browser:
-            try:
-                loop = asyncio.get_event_loop()
-                loop.run_until_complete(self.close_browser())
-            except Exception:
-                pass
+    All callers share its browser, so Chromium is launched at most once per
+    process and closed when the process exits. A worker forked from a process
+    that already has one gets its own.
+    
+    Args:
+        cache_dir: Directory for rendered SVGs; the renderer uses the one
+            given by the latest caller
+        
+    Returns:
+        The shared MermaidRenderer
+    """
+    global _shared_renderer, _shared_renderer_pid
+    if _shared_renderer is None or _shared_renderer_pid != os.getpid():
+        _shared_renderer = MermaidRenderer(cache_dir)
+        _shared_renderer_pid = os.getpid()
+    else:
+        _shared_renderer.cache_dir = cache_dir
+    return _shared_renderer
+
+def shared_renderer_running():
+    """
+    Whether this process's shared renderer has started its event loop thread
+    
+    A process forked while that thread runs would inherit the loop and the
+    browser connection in whatever state the thread left them.
+    """
+    return (_shared_renderer is not None and _shared_renderer_pid == os.getpid()
+            and _shared_renderer.loop is not None)
+
+def _close_shared_renderer():
+    """Close the shared renderer's browser when the process exits"""
+    if _shared_renderer is None or _shared_renderer_pid != os.getpid():
+        return
+    if _shared_renderer.loop is None:
+        # Nothing was rendered through the synchronous wrappers
+        return
+    try:
+        _shared_renderer._run_sync(_shared_renderer.close_browser())
+    except Exception:
+        pass
+    _shared_renderer.loop.call_soon_threadsafe(_shared_renderer.loop.stop)
+
+atexit.register(_close_shared_renderer)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The application modules import each other from src (e.g. utils.file_utils)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,28 @@
+from exporters.markdown_processor import MarkdownProcessor
+
+def test_code_block_in_blockquote_is_not_nested_in_a_paragraph():
+    html = MarkdownProcessor().process_markdown("> quote\n> ```python\n> x = 1\n> ```\n> tail\n\nafter\n")
+
+    assert '<p>quote</p>' in html
+    assert '<div class="codehilite">' in html
+    assert '<p>tail</p>' in html
+    assert html.count('<blockquote>') == 1
+    # The highlighted block is a sibling of the quote's paragraphs
+    for paragraph in html.split('<p>')[1:]:
+        assert '<div' not in paragraph.split('</p>')[0]
+
+def test_code_block_in_list_item_stays_in_the_item():
+    html = MarkdownProcessor().process_markdown("1. item\n   ```python\n   x = 1\n   ```\n2. next\n")
+
+    item = html.split('<li>')[1]
+    assert item.startswith('item')
+    assert '<div class="codehilite">' in item
+    assert '<p>' not in html
+    assert '<li>next</li>' in html
+
+def test_nul_in_input_is_not_taken_for_a_placeholder():
+    html = MarkdownProcessor().process_markdown("text \x00CODE0\x00 here\n\n```python\nx = 1\n```\n")
+
+    assert '<p>text CODE0 here</p>' in html
+    assert '\x00' not in html
+    assert html.count('<div class="codehilite">') == 1
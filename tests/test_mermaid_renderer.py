@@ -0,0 +1,47 @@
+import asyncio
+
+from utils import mermaid_renderer
+from utils.mermaid_renderer import MermaidRenderer
+
+class FakePage:
+    """Page whose render of a 'slow' diagram never finishes"""
+    def __init__(self, pages):
+        self.closed = False
+        self.rendered = []
+        pages.append(self)
+
+    async def set_content(self, html):
+        pass
+
+    async def evaluate(self, script, args):
+        diagram_id, code = args
+        if code == 'slow':
+            await asyncio.sleep(3600)
+        self.rendered.append(code)
+        return f'<svg id="{diagram_id}"></svg>'
+
+    async def close(self):
+        self.closed = True
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+
+    async def new_page(self):
+        return FakePage(self.pages)
+
+def test_page_is_replaced_after_a_render_timeout(monkeypatch):
+    monkeypatch.setattr(mermaid_renderer, 'MERMAID_RENDER_TIMEOUT', 0.01)
+    renderer = MermaidRenderer()
+    context = FakeContext()
+    jobs = iter([(('slow', 'a' * 32), [0]), (('graph TD', 'b' * 32), [1])])
+    results = [None, None]
+
+    asyncio.run(renderer._render_jobs(context, 'default', jobs, results))
+
+    assert isinstance(results[0], asyncio.TimeoutError)
+    assert isinstance(results[1], str)
+    # The timed-out page is closed and the next diagram renders in a new one
+    first, second = context.pages
+    assert first.closed and first.rendered == []
+    assert second.closed and second.rendered == ['graph TD']
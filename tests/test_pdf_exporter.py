@@ -0,0 +1,112 @@
+from exporters import pdf_exporter
+from exporters.markdown_processor import MarkdownProcessor
+
+MERMAID_MARKDOWN = "# Diagram\n\n```mermaid\ngraph TD\n    A --> B\n```\n"
+
+class FakeMermaidRenderer:
+    """Stands in for the browser-backed renderer and counts the renders"""
+    def __init__(self):
+        self.renders = 0
+
+    def render_mermaid_batch_sync(self, mermaid_codes, theme='default'):
+        self.renders += 1
+        return [f'<svg id="render-{self.renders}"></svg>' for _ in mermaid_codes]
+
+class FlakyMermaidRenderer(FakeMermaidRenderer):
+    """Fails every diagram of the first batch, as after a browser error"""
+    def render_mermaid_batch_sync(self, mermaid_codes, theme='default'):
+        if not self.renders:
+            self.renders += 1
+            return [RuntimeError('browser crashed') for _ in mermaid_codes]
+        return super().render_mermaid_batch_sync(mermaid_codes, theme)
+
+def _processor(renderer_class=FakeMermaidRenderer):
+    processor = MarkdownProcessor()
+    processor.mermaid_renderer = renderer_class()
+    return processor
+
+def test_cached_html_is_invalidated_by_mermaid_version(tmp_path, monkeypatch):
+    md_file = tmp_path / 'doc.md'
+    md_file.write_text(MERMAID_MARKDOWN, encoding='utf-8')
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    processor = _processor()
+
+    first = pdf_exporter._convert_markdown_file(processor, str(md_file), str(cache_dir))
+    assert 'render-1' in first
+    # Unchanged file and versions: served from the HTML cache
+    assert pdf_exporter._convert_markdown_file(processor, str(md_file), str(cache_dir)) == first
+    assert processor.mermaid_renderer.renders == 1
+
+    # A new Mermaid output version must not reuse HTML with the old SVGs
+    monkeypatch.setattr(pdf_exporter, 'MERMAID_CACHE_VERSION', pdf_exporter.MERMAID_CACHE_VERSION + '-next-release')
+    second = pdf_exporter._convert_markdown_file(processor, str(md_file), str(cache_dir))
+    assert processor.mermaid_renderer.renders == 2
+    assert 'render-2' in second
+
+def _assembled_section_html(sections, converted, monkeypatch):
+    """Run export_to_pdf_with_sections and return the book body it assembles"""
+    exporter = pdf_exporter.PdfExporter({})
+    written = []
+    monkeypatch.setattr(exporter, '_convert_files', lambda md_files: converted)
+    monkeypatch.setattr(exporter, '_write_pdf', lambda html_parts, output_path, generator: written.append(''.join(html_parts)))
+    assert exporter.export_to_pdf_with_sections(sections, 'book.pdf')
+    return written[0]
+
+def test_section_page_breaks(monkeypatch):
+    converted = {name: f'<p>{name}</p>' for name in ('a.md', 'b.md', 'c.md', 'd.md', 'e.md')}
+    sections = [
+        {'title': 'Part 1', 'type': 'major_section', 'files': []},
+        {'title': 'Chapter 1', 'type': 'subsection', 'files': ['a.md', 'b.md']},
+        {'title': 'Chapter 2', 'type': 'subsection', 'files': ['c.md']},
+        {'title': 'Part 2', 'type': 'major_section', 'files': []},
+        {'title': 'Chapter 3', 'type': 'subsection', 'files': ['d.md', 'missing.md']},
+        {'title': 'Appendix', 'type': 'section', 'files': ['e.md']},
+    ]
+    html = _assembled_section_html(sections, converted, monkeypatch)
+
+    # Breaks after a.md and b.md (a subsection follows); none after c.md
+    # (Part 2 starts a page), d.md (the Appendix header starts a page) or
+    # e.md (end of the book)
+    assert html.count(pdf_exporter._FILE_PAGE_BREAK) == 2
+    assert '<p>a.md</p>' + pdf_exporter._FILE_PAGE_BREAK + '<p>b.md</p>' + pdf_exporter._FILE_PAGE_BREAK in html
+    assert '<p>c.md</p><div class="major-section-header">' in html
+    # Every major section still ends with its own break
+    assert html.count(pdf_exporter._MAJOR_SECTION_BREAK) == 2
+
+def test_major_section_files_have_no_trailing_file_break(monkeypatch):
+    converted = {'a.md': '<p>a.md</p>', 'b.md': '<p>b.md</p>'}
+    sections = [
+        {'title': 'Part 1', 'type': 'major_section', 'files': ['a.md', 'b.md']},
+        {'title': 'Chapter 1', 'type': 'subsection', 'files': []},
+    ]
+    html = _assembled_section_html(sections, converted, monkeypatch)
+
+    assert html.count(pdf_exporter._FILE_PAGE_BREAK) == 1
+    assert '<p>b.md</p>' + pdf_exporter._MAJOR_SECTION_BREAK in html
+
+def test_changed_file_replaces_its_cached_html(tmp_path, monkeypatch):
+    md_file = tmp_path / 'doc.md'
+    md_file.write_text('# First\n', encoding='utf-8')
+    exporter = pdf_exporter.PdfExporter({})
+    monkeypatch.setattr(pdf_exporter, '_process_markdown_file', lambda path, cache_dir=None: (open(path, encoding='utf-8').read(), True))
+
+    assert exporter._convert_files([str(md_file)]) == {str(md_file): '# First\n'}
+    md_file.write_text('# Second revision\n', encoding='utf-8')
+    assert exporter._convert_files([str(md_file)]) == {str(md_file): '# Second revision\n'}
+    # The first revision's HTML is not kept alongside the new one
+    assert len(exporter._md_cache) == 1
+
+def test_mermaid_fallback_html_is_not_kept_in_memory(tmp_path, monkeypatch):
+    md_file = tmp_path / 'doc.md'
+    md_file.write_text(MERMAID_MARKDOWN, encoding='utf-8')
+    processor = _processor(FlakyMermaidRenderer)
+    monkeypatch.setattr(pdf_exporter, '_get_processor', lambda cache_dir=None: processor)
+    exporter = pdf_exporter.PdfExporter({})
+
+    assert 'language-mermaid' in exporter._convert_files([str(md_file)])[str(md_file)]
+    assert exporter._md_cache == {}
+    # The next export renders the diagram again and keeps the result
+    assert 'render-2' in exporter._convert_files([str(md_file)])[str(md_file)]
+    assert 'render-2' in exporter._convert_files([str(md_file)])[str(md_file)]
+    assert processor.mermaid_renderer.renders == 2